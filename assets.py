@@ -0,0 +1,138 @@
+'''
+fonts, images and sounds are loaded on first use instead of at import.
+images are converted to the display pixel format once a display exists, so blitting them
+does not need a per-pixel format conversion.
+'''
+
+import os
+import threading
+import pygame
+
+FONT_PATH = os.path.join("assets", "fonts", "Pixel.ttf")
+FONT_SIZES = (35, 50) # sizes loaded by preload
+
+IMAGE_PATHS = {"BLOCK_BLUE":   os.path.join("assets", "block_blue.png"),
+               "BLOCK_CYAN":   os.path.join("assets", "block_cyan.png"),
+               "BLOCK_GREEN":  os.path.join("assets", "block_green.png"),
+               "BLOCK_ORANGE": os.path.join("assets", "block_orange.png"),
+               "BLOCK_PURPLE": os.path.join("assets", "block_purple.png"),
+               "BLOCK_RED":    os.path.join("assets", "block_red.png"),
+               "BLOCK_YELLOW": os.path.join("assets", "block_yellow.png"),
+               "BACKGROUND":   os.path.join("assets", "cathedral.jpg")}
+
+BLOCK_NAMES = [False,
+               "BLOCK_BLUE",
+               "BLOCK_CYAN",
+               "BLOCK_GREEN",
+               "BLOCK_ORANGE",
+               "BLOCK_PURPLE",
+               "BLOCK_RED",
+               "BLOCK_YELLOW"] # indexed by tet colour
+
+SOUND_PATHS = {"DROP":          os.path.join("assets", "sfx", "drop.wav"),
+               "CLEAR1":        os.path.join("assets", "sfx", "clear1.wav"),
+               "CLEAR2":        os.path.join("assets", "sfx", "clear2.wav"),
+               "CLEAR3":        os.path.join("assets", "sfx", "clear3.wav"),
+               "CLEAR4":        os.path.join("assets", "sfx", "clear4.wav"),
+               "DIFFICULTY_UP": os.path.join("assets", "sfx", "difficulty_up.wav")}
+
+fonts = {} # size -> pygame.font.Font
+images = {} # name -> surface, converted once the display exists
+converted = set() # names of images that are in the display format
+blocks = [False for i in BLOCK_NAMES] # converted block images by colour, filled by get_block
+sounds = {} # name -> pygame.mixer.Sound
+sound_volume = 1
+lock = threading.Lock() # guards the dicts above while preloading in the background
+
+def get_font(size):
+    font = fonts.get(size)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = pygame.font.Font(FONT_PATH, size)
+        with lock:
+            font = fonts.setdefault(size, font)
+    return font
+
+def load_image(name):
+    image = images.get(name)
+    if image is None:
+        image = pygame.image.load(IMAGE_PATHS[name])
+        with lock:
+            image = images.setdefault(name, image)
+    return image
+
+def get_image(name):
+    '''
+    returns the image, converted to the display format if the display has been created
+    '''
+    image = load_image(name)
+    if name not in converted and pygame.display.get_surface() is not None:
+        if image.get_flags() & pygame.SRCALPHA:
+            image = image.convert_alpha()
+        else:
+            image = image.convert()
+        images[name] = image
+        converted.add(name)
+    return image
+
+def get_block(color):
+    block = blocks[color]
+    if block == False:
+        block = get_image(BLOCK_NAMES[color])
+        if BLOCK_NAMES[color] in converted:
+            blocks[color] = block
+    return block
+
+def get_sound(name):
+    '''
+    returns the sound or False if there is no mixer (e.g. no audio device)
+    '''
+    sound = sounds.get(name)
+    if sound is None:
+        if not pygame.mixer.get_init():
+            return False
+        sound = pygame.mixer.Sound(SOUND_PATHS[name])
+        sound.set_volume(sound_volume)
+        with lock:
+            sound = sounds.setdefault(name, sound)
+    return sound
+
+def set_sound_volume(volume):
+    global sound_volume
+    sound_volume = volume
+    for sound in sounds.values():
+        sound.set_volume(volume)
+
+def preload():
+    '''
+    loads every asset that is not loaded yet. does not convert images, see convert_loaded
+    '''
+    for size in FONT_SIZES:
+        get_font(size)
+    for name in IMAGE_PATHS:
+        load_image(name)
+    for name in SOUND_PATHS:
+        get_sound(name)
+
+def preload_in_background():
+    '''
+    starts preload in a thread and returns the thread
+    '''
+    thread = threading.Thread(target=preload, daemon=True)
+    thread.start()
+    return thread
+
+def get_progress():
+    '''
+    fraction of the assets preload loads that are loaded
+    '''
+    total = len(FONT_SIZES) + len(IMAGE_PATHS) + len(SOUND_PATHS)
+    return (len(fonts) + len(images) + len(sounds)) / total
+
+def convert_loaded():
+    '''
+    converts all loaded images to the display format, has to be called from the main thread
+    '''
+    for name in list(images):
+        get_image(name)
@@ -0,0 +1,129 @@
+'''
+sound effects play on a small pool of reserved mixer channels. every sound has a priority:
+a new sound takes a free channel, else the oldest channel playing something less important.
+sounds of KEEP_PRIORITY or more (line clears, difficulty up) are never dropped, if there is no
+less important channel they cut off the oldest of the least important ones. repeated drop sounds
+restart their channel instead of taking another one.
+
+the mixer buffer is set before pygame.init with init_mixer, smaller buffers are heard sooner
+but need the audio thread to keep up.
+'''
+
+import time
+from collections import deque
+import pygame
+import assets
+
+MIXER_FREQUENCY = 44100
+MIXER_BUFFER = 512 # samples, about 12 ms at MIXER_FREQUENCY. pygame's default is 512 to 4096 depending on version
+MIN_BUFFER = 64
+MAX_BUFFER = 8192
+POOL_SIZE = 4 # reserved channels, Sound.play without a channel never takes them
+
+SOUND_PRIORITIES = {"DROP": 0,
+                    "CLEAR1": 1,
+                    "CLEAR2": 1,
+                    "CLEAR3": 1,
+                    "CLEAR4": 1,
+                    "DIFFICULTY_UP": 2} # sound name (see engine.SOUNDS) -> priority
+KEEP_PRIORITY = 1 # sounds with at least this priority are never dropped
+COALESCED = ("DROP",) # sounds that restart the channel they are playing on
+LATENCY_SAMPLES = 256 # play calls the latency is averaged over
+
+buffer_size = MIXER_BUFFER # buffer passed to the mixer by init_mixer
+
+def init_mixer(buffer=MIXER_BUFFER):
+    '''
+    sets the mixer format, has to be called before pygame.init
+    '''
+    global buffer_size
+    buffer_size = max(MIN_BUFFER, min(MAX_BUFFER, buffer))
+    pygame.mixer.pre_init(MIXER_FREQUENCY, -16, 2, buffer_size)
+
+def get_buffer_latency():
+    '''
+    seconds of audio in the mixer buffer, the time a started sound needs at least until it is heard
+    '''
+    init = pygame.mixer.get_init()
+    if not init:
+        return 0
+    return buffer_size / init[0]
+
+class SoundPool:
+    def __init__(self, size=POOL_SIZE):
+        self.channels = [] # stays empty if there is no mixer
+        if pygame.mixer.get_init():
+            if pygame.mixer.get_num_channels() < size * 2:
+                pygame.mixer.set_num_channels(size * 2)
+            pygame.mixer.set_reserved(size)
+            self.channels = [pygame.mixer.Channel(i) for i in range(size)]
+        self.names = [False for channel in self.channels] # name of the sound last started per channel
+        self.priorities = [0 for channel in self.channels]
+        self.started = [0 for channel in self.channels] # perf_counter time the sound was started at
+        self.latencies = deque(maxlen=LATENCY_SAMPLES) # seconds from the event to the play call
+        self.played = 0
+        self.coalesced = 0
+        self.stolen = 0 # sounds cut off for a more important one
+        self.dropped = 0 # sounds not played because every channel had something more important
+
+    def get_channel(self, name, priority):
+        '''
+        returns the index of the channel name should play on or -1 if it has to be dropped
+        '''
+        if name in COALESCED:
+            for index, channel in enumerate(self.channels):
+                if self.names[index] == name and channel.get_busy():
+                    self.coalesced += 1
+                    return index
+
+        steal = -1
+        for index, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                return index
+            if self.priorities[index] < priority or priority >= KEEP_PRIORITY:
+                if steal == -1 or (self.priorities[index], self.started[index]) < (self.priorities[steal], self.started[steal]):
+                    steal = index
+        if steal != -1:
+            self.stolen += 1
+        return steal
+
+    def play(self, name, timestamp=None):
+        '''
+        plays the sound called name, timestamp is the perf_counter time of the event that caused it.
+        returns False if it was not played
+        '''
+        sound = assets.get_sound(name)
+        if sound == False or not self.channels:
+            return False
+        priority = SOUND_PRIORITIES.get(name, 0)
+        index = self.get_channel(name, priority)
+        if index == -1:
+            self.dropped += 1
+            return False
+
+        self.channels[index].play(sound)
+        now = time.perf_counter()
+        self.names[index] = name
+        self.priorities[index] = priority
+        self.started[index] = now
+        self.played += 1
+        if timestamp is not None:
+            self.latencies.append(now - timestamp)
+        return True
+
+    def stop(self):
+        for channel in self.channels:
+            channel.stop()
+        return self
+
+    def get_stats(self):
+        '''
+        latency_ms: mean time from the event to the play call plus the mixer buffer
+        '''
+        latency = sum(self.latencies) / len(self.latencies) if self.latencies else 0
+        return {"played": self.played,
+                "coalesced": self.coalesced,
+                "stolen": self.stolen,
+                "dropped": self.dropped,
+                "buffer_ms": get_buffer_latency() * 1000,
+                "latency_ms": (latency + get_buffer_latency()) * 1000}
@@ -0,0 +1,218 @@
+'''
+numpy version of the engine rules that steps many levels in lockstep.
+needs numpy, the rest of the game does not.
+
+every board is stored as 21 row bitmasks like BitLevel.rows (bit x set = column x occupied),
+all boards together are a single (n, ROWS) array (see get_rows). colours are not tracked.
+'''
+
+import numpy as np
+from engine import all_pieces, piece_table, FULL_ROW
+
+ACTION_NONE = 0
+ACTION_LEFT = 1
+ACTION_RIGHT = 2
+ACTION_ROTATE = 3
+ACTION_DROP = 4 # same as holding the drop key for this step
+
+PAD = 4 # extra empty rows below the board so row lookups of pieces below the floor need no clipping
+ROWS = 21 + PAD # rows stored per board
+
+SCORE_BASE = np.array([1, 100, 300, 500, 800], dtype=np.int64) # multiplied by difficulty, see Level.score_rewards
+
+'''
+piece tables indexed by [piece * 4 + rotation], pieces with less than 4 rotations repeat them.
+column tables are also indexed by grid column x + X_OFF so positions just outside the board can be looked up.
+SHIFTED[s, x + X_OFF, k] is the row mask the piece covers in row y + MIN_Y[s] + k, all 0 if out of bounds
+'''
+X_OFF = 3
+ROT_COUNT = np.array([len(piece) for piece in all_pieces], dtype=np.int64)
+MIN_Y = np.zeros(7 * 4, dtype=np.int64)
+ROW_MAX = np.zeros(7 * 4, dtype=np.int64)
+OOB_X = np.ones((7 * 4, 10 + 2 * X_OFF), dtype=bool)
+SHIFTED = np.zeros((7 * 4, 10 + 2 * X_OFF, 4), dtype=np.int64)
+
+for piece_index, shapes in enumerate(piece_table):
+    for rot in range(4):
+        shape = shapes[rot % len(shapes)]
+        s = piece_index * 4 + rot
+        MIN_Y[s] = shape.min_y
+        ROW_MAX[s] = shape.row_max
+        for x in range(shape.col_min, shape.col_max + 1):
+            OOB_X[s, x + X_OFF] = False
+            for dy, mask in shape.masks:
+                SHIFTED[s, x + X_OFF, dy - shape.min_y] = mask << (x + shape.min_x)
+
+ROW_OFFSETS = np.arange(4, dtype=np.int64)
+DX = np.array([0, -1, 1, 0, 0], dtype=np.int64) # x movement per action
+
+class BatchLevel:
+    '''
+    n levels following the same rules as Level, advanced together with step().
+    boards that are game over stay frozen until reset() is called for them.
+    '''
+    def __init__(self, n, seed=None, tpf=2):
+        self.n = n
+        self.tpf = tpf
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros((n, ROWS), dtype=np.int64)
+        self.piece = np.zeros(n, dtype=np.int64)
+        self.rot = np.zeros(n, dtype=np.int64)
+        self.x = np.zeros(n, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.current_tick = np.zeros(n, dtype=np.float64)
+        self.tpf_adjusted = np.zeros(n, dtype=np.float64)
+        self.dropping_tpf = np.zeros(n, dtype=np.float64)
+        self.difficulty = np.zeros(n, dtype=np.int64)
+        self.difficulty_stage = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lines = np.zeros(n, dtype=np.int64)
+        self.placed = np.zeros(n, dtype=np.int64)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.difficulty_increase_on_stage = 20
+        self.max_difficulty = 20
+        self.reset()
+
+    def reset(self, which=None):
+        '''
+        starts new levels on the boards selected by which (bool mask or indices), all boards if None
+        '''
+        if which is None:
+            which = np.arange(self.n)
+        elif np.asarray(which).dtype == bool:
+            which = np.flatnonzero(which)
+        self.boards[which] = 0
+        self.difficulty[which] = 1
+        self.difficulty_stage[which] = 0
+        self.score[which] = 0
+        self.lines[which] = 0
+        self.placed[which] = 0
+        self.game_over[which] = False
+        self.spawn(which)
+        return self
+
+    def spawn(self, which):
+        '''
+        gives the boards in which a new piece at the top, same as creating a new Tet
+        '''
+        self.piece[which] = self.rng.integers(0, 7, len(which))
+        self.rot[which] = 0
+        self.x[which] = 5
+        self.y[which] = 1
+        self.current_tick[which] = 0
+        self.tpf_adjusted[which] = self.tpf * self.difficulty[which] // 1.4
+        self.dropping_tpf[which] = self.tpf_adjusted[which] * 10
+
+    def collides(self, which, x, y, rot):
+        '''
+        returns a bool per board in which, True if its piece at grid position x, y with rotation rot
+        would be out of bounds or overlap a settled block. same as Level.collides
+        '''
+        s = self.piece[which] * 4 + rot
+        x = np.clip(x + X_OFF, 0, 10 + 2 * X_OFF - 1)
+        oob = OOB_X[s, x] | (y > ROW_MAX[s])
+        rows = (which * ROWS + np.minimum(y, 21) + MIN_Y[s])[:, None] + ROW_OFFSETS
+        hit = (self.boards.ravel().take(rows) & SHIFTED[s, x]).any(axis=1)
+        return oob | hit
+
+    def step(self, actions):
+        '''
+        applies one action per board (ACTION_* constants) and then advances every board by one frame,
+        the same as one Game.handle_input followed by one Level.update.
+        returns (score gained, lines cleared, game over) arrays for this step
+        '''
+        actions = np.asarray(actions)
+        reward = np.zeros(self.n, dtype=np.int64)
+        cleared = np.zeros(self.n, dtype=np.int64)
+        alive = ~self.game_over
+
+        '''
+        input, moves and rotations are checked together
+        '''
+        which = np.flatnonzero(alive & (actions >= ACTION_LEFT) & (actions <= ACTION_ROTATE))
+        if len(which):
+            x = self.x[which] + DX[actions[which]]
+            rot = self.rot[which]
+            rot = np.where(actions[which] == ACTION_ROTATE, (rot + 1) % ROT_COUNT[self.piece[which]], rot)
+            ok = ~self.collides(which, x, self.y[which], rot)
+            which = which[ok]
+            self.x[which] = x[ok]
+            self.rot[which] = rot[ok]
+
+        '''
+        Level.update
+        '''
+        level_up = alive & (self.difficulty_stage >= self.difficulty_increase_on_stage) & (self.difficulty < self.max_difficulty)
+        self.difficulty[level_up] += 1
+        self.difficulty_stage[level_up] = 0
+
+        '''
+        Tet.tick
+        '''
+        moving = alive & (self.current_tick >= 100)
+        speed = np.where(actions == ACTION_DROP, self.dropping_tpf, self.tpf_adjusted)
+        self.current_tick += speed * alive
+        self.current_tick[moving] = 0
+
+        '''
+        Tet.update
+        '''
+        which = np.flatnonzero(moving)
+        if len(which):
+            self.tpf_adjusted[which] = self.tpf * self.difficulty[which] // 1.4
+            self.dropping_tpf[which] = np.maximum(self.tpf_adjusted[which] * 10, 30)
+
+            landed = self.collides(which, self.x[which], self.y[which] + 1, self.rot[which])
+            self.y[which[~landed]] += 1
+            which = which[landed]
+            if len(which):
+                self.assimilate(which, reward, cleared)
+
+        return reward, cleared, self.game_over.copy()
+
+    def assimilate(self, which, reward, cleared):
+        '''
+        locks the pieces of the boards in which, clears lines, adds score and spawns new pieces
+        '''
+        s = self.piece[which] * 4 + self.rot[which]
+        rows = (self.y[which] + MIN_Y[s])[:, None] + ROW_OFFSETS
+        self.boards[which[:, None], rows] |= SHIFTED[s, self.x[which] + X_OFF]
+
+        '''
+        clear lines, kept rows keep their order and the empty rows are inserted below row 0
+        like Level.push_lines does
+        '''
+        board = self.boards[which, :21]
+        full = board == FULL_ROW
+        lines = full.sum(axis=1)
+        if lines.any():
+            kept = ~full
+            rank = np.cumsum(kept, axis=1) - 1
+            target = np.where(rank == 0, 0, rank + lines[:, None])
+            new_board = np.zeros_like(board)
+            board_index = np.broadcast_to(np.arange(len(which))[:, None], board.shape)
+            new_board[board_index[kept], target[kept]] = board[kept]
+            self.boards[which, :21] = new_board
+
+        gained = SCORE_BASE[lines] * self.difficulty[which]
+        self.score[which] += gained
+        self.lines[which] += lines
+        self.placed[which] += 1
+        self.difficulty_stage[which] += lines
+        reward[which] = gained
+        cleared[which] = lines
+
+        self.spawn(which)
+        self.game_over[which] = self.boards[which, 1] != 0
+
+    def get_rows(self):
+        '''
+        returns the (n, 21) row bitmasks of all boards
+        '''
+        return self.boards[:, :21]
+
+    def get_cells(self):
+        '''
+        returns the boards as an (n, 21, 10) bool array, [board, y, x]
+        '''
+        return (self.get_rows()[:, :, None] >> np.arange(10)) & 1 == 1
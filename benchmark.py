@@ -0,0 +1,510 @@
+#!/usr/bin/python3
+
+'''
+benchmarks, run with ./benchmark.py [output.json]
+everything runs headless on SDL's dummy video and audio drivers. results are printed and written
+as json, compare two runs with ./benchmark.py --compare old.json new.json
+'''
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import engine
+import replay
+import snapshot
+
+REPEAT = 5 # runs per measurement, the best and the median run are reported
+SNAPSHOT_PATH = "saved_game.snapshot" # real mid-game position used by bench_snapshot if it exists
+SCORE_COUNTS = (10, 10000, 1000000) # FileHandler sizes
+MENU_SIZES = (5, 20, 100) # buttons per gui.Container
+WINDOW_SIZES = ((400, 800), (800, 1600), (1200, 2400), (600, 1200)) # window sizes for display.Display, 1x, 2x, 3x and 1.5x
+COMPARED = {"best_us": ("us", 1),
+            "bytes": ("B", 1),
+            "per_s": ("/s", -1),
+            "board_steps_per_s": ("/s", -1),
+            "frames_per_s": ("/s", -1)} # result key compare looks at -> (unit, 1 if lower is better, -1 if higher is)
+
+def measure(fun, number, setup=None, repeat=REPEAT):
+    '''
+    calls fun number times per run and returns microseconds per call of the best and the median run.
+    if setup is given it is called before every call of fun and not timed
+    '''
+    runs = []
+    for i in range(repeat):
+        if setup is None:
+            start = time.perf_counter()
+            for j in range(number):
+                fun()
+            runs.append(time.perf_counter() - start)
+        else:
+            total = 0
+            for j in range(number):
+                setup()
+                start = time.perf_counter()
+                fun()
+                total += time.perf_counter() - start
+            runs.append(total)
+
+    runs.sort()
+    return {"number": number,
+            "best_us": runs[0] / number * 1e6,
+            "median_us": runs[len(runs) // 2] / number * 1e6}
+
+def report(results):
+    for name, result in results.items():
+        if "best_us" in result:
+            print(f"{name:40} {result['best_us']:12.2f} us  (median {result['median_us']:.2f} us, {result['number']} calls)")
+        else:
+            print(f"{name:40} {result}")
+    return results
+
+def populated_level(level_class, seed=0):
+    '''
+    level with the bottom 12 rows filled except for one random hole per row, no line is full
+    '''
+    level = level_class(seed)
+    rng = random.Random(seed)
+    for y in range(9, 21):
+        hole = rng.randrange(10)
+        for x in range(10):
+            if x != hole:
+                level.map[y][x] = rng.randint(1, 7)
+    return level.rebuild_from_map()
+
+def copy_board(source, level):
+    level.map = [row.copy() for row in source.map]
+    level.rebuild_from_map()
+
+def play_placements(level_class, placements, seed=0):
+    '''
+    plays random moves with the drop key held until placements pieces have been placed.
+    starts a new level whenever one is game over.
+    returns seconds taken
+    '''
+    random.seed(seed)
+    moves = random.Random(seed)
+    level = level_class()
+    placed = 0
+
+    def on_score(reward):
+        nonlocal placed
+        placed += 1
+
+    level.add_hook("score", on_score)
+
+    start = time.perf_counter()
+    while placed < placements:
+        if level.check_game_over():
+            level = level_class()
+            level.add_hook("score", on_score)
+
+        tet = level.get_tet()
+        tet.set_dropping(True)
+        move = moves.random()
+        if move < 0.3:
+            tet.move_l()
+        elif move < 0.6:
+            tet.move_r()
+        elif move < 0.7:
+            tet.try_rotate()
+        level.update()
+
+    return time.perf_counter() - start
+
+def bench_placements(placements=5000):
+    '''
+    placement heavy benchmark of Level against BitLevel
+    '''
+    level_time = play_placements(engine.Level, placements)
+    bit_level_time = play_placements(engine.BitLevel, placements)
+
+    print(f"Level:    {placements / level_time:.0f} placements/s")
+    print(f"BitLevel: {placements / bit_level_time:.0f} placements/s")
+    print(f"speedup:  {level_time / bit_level_time:.2f}x")
+    return {"placements.Level": {"per_s": placements / level_time},
+            "placements.BitLevel": {"per_s": placements / bit_level_time}}
+
+def bench_batch(n=4096, steps=500):
+    '''
+    board-steps per second of BatchLevel against looping over Level objects
+    '''
+    import numpy as np
+    import batch
+
+    levels = [engine.BitLevel() for i in range(64)]
+    moves = random.Random(0)
+    start = time.perf_counter()
+    for i in range(steps):
+        for index, level in enumerate(levels):
+            if level.check_game_over():
+                level = levels[index] = engine.BitLevel()
+            move = moves.random()
+            tet = level.get_tet()
+            tet.set_dropping(move > 0.5)
+            if move < 0.2:
+                tet.move_l()
+            elif move < 0.4:
+                tet.move_r()
+            elif move < 0.5:
+                tet.try_rotate()
+            level.update()
+    level_rate = len(levels) * steps / (time.perf_counter() - start)
+
+    levels = batch.BatchLevel(n, seed=0)
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, 5, (steps, n))
+    start = time.perf_counter()
+    for i in range(steps):
+        game_over = levels.step(actions[i])[2]
+        if game_over.any():
+            levels.reset(game_over)
+    batch_rate = n * steps / (time.perf_counter() - start)
+
+    print(f"Level loop: {level_rate:.0f} board-steps/s")
+    print(f"BatchLevel: {batch_rate:.0f} board-steps/s ({n} boards)")
+    print(f"speedup:    {batch_rate / level_rate:.1f}x")
+    return {"batch.Level_loop": {"board_steps_per_s": level_rate},
+            "batch.BatchLevel": {"board_steps_per_s": batch_rate}}
+
+def bench_replay(path="last_game.replay", repeat=20):
+    '''
+    replays a recorded game headless repeat times
+    '''
+    recorded = replay.load_replay(path)
+    start = time.perf_counter()
+    for i in range(repeat):
+        level = recorded.play()
+    seconds = (time.perf_counter() - start) / repeat
+
+    print(f"replay:     {level.get_frame()} frames in {seconds * 1000:.1f} ms ({level.get_frame() / seconds:.0f} frames/s)")
+    return {"replay.play": {"frames_per_s": level.get_frame() / seconds}}
+
+def bench_snapshot(path=SNAPSHOT_PATH):
+    '''
+    taking and restoring snapshots of the game saved at path (populated_level if there is none)
+    and playing on from the restored position
+    '''
+    if os.path.exists(path):
+        source = snapshot.load(path)
+    else:
+        source = populated_level(engine.BitLevel)
+    data = snapshot.take(source)
+    results = {}
+    results["snapshot.take"] = measure(lambda: snapshot.take(source), 2000)
+    results["snapshot.restore"] = measure(lambda: snapshot.restore(data), 2000)
+    results["snapshot.size"] = {"bytes": len(data)}
+
+    levels = [source]
+    def play_on():
+        level = levels[0]
+        for i in range(60):
+            if level.check_game_over():
+                break
+            level.update()
+    results["snapshot.play_60_frames"] = measure(play_on, 200, lambda: levels.__setitem__(0, snapshot.restore(data)))
+
+    return report(results)
+
+def bench_engine(level_class):
+    '''
+    collision checks, line clears, locking and gravity of level_class on a populated board
+    '''
+    name = "engine." + level_class.__name__
+    results = {}
+
+    level = populated_level(level_class)
+    level.tet = engine.Tet(level, piece=engine.all_pieces[0])
+    level.tet.grid_y = 7 # just above the filled rows
+    results[name + ".occupied"] = measure(lambda: level.occupied(0, 1), 100000)
+    results[name + ".oob"] = measure(lambda: level.oob(0, 1), 100000)
+    results[name + ".collides"] = measure(lambda: level.collides(0, 1), 100000)
+    results[name + ".clear_lines_0"] = measure(level.clear_lines, 10000)
+    results[name + ".get_drop_y"] = measure(level.get_drop_y, 100000)
+
+    holes = populated_level(level_class)
+    full = populated_level(level_class)
+    for y in range(17, 21):
+        for x in range(10):
+            if full.map[y][x] == 0:
+                full.map[y][x] = 1
+    full.rebuild_from_map()
+    results[name + ".clear_lines_4"] = measure(level.clear_lines, 2000, lambda: copy_board(full, level))
+
+    def place_tet():
+        copy_board(holes, level)
+        level.tet = engine.Tet(level, piece=engine.all_pieces[0])
+        level.tet.grid_y = 7
+    results[name + ".assimilate"] = measure(level.assimilate, 2000, place_tet)
+
+    '''
+    one gravity cycle: updates until the falling tet moved down one row
+    '''
+    levels = [level_class(0)]
+    def gravity_cycle():
+        tet = levels[0].get_tet()
+        y = tet.get_grid_y()
+        while levels[0].get_tet() is tet and tet.get_grid_y() == y:
+            levels[0].update()
+    results[name + ".tet_update_cycle"] = measure(gravity_cycle, 200, lambda: levels.__setitem__(0, level_class(0)))
+
+    return report(results)
+
+def init_display():
+    '''
+    creates the (dummy) display and loads the assets like game.main does
+    '''
+    import pygame
+    import assets
+    import audio
+    audio.init_mixer()
+    pygame.init()
+    screen = pygame.display.set_mode((engine.LEVEL_W, engine.LEVEL_H))
+    assets.preload()
+    assets.convert_loaded()
+    return screen
+
+def clear_assets():
+    '''
+    forgets every loaded asset and pre-rendered sprite, like a fresh start of the game
+    '''
+    import assets
+    import game
+    assets.fonts.clear()
+    assets.images.clear()
+    assets.converted.clear()
+    assets.sounds.clear()
+    for color in range(len(assets.blocks)):
+        assets.blocks[color] = False
+    game.sprite_cache.clear()
+
+def bench_assets(screen):
+    '''
+    time to the first frame (preload, convert_loaded and the first LevelRenderer.draw) with nothing loaded,
+    the asset files are in the os file cache after the first run. and blitting the background and a block
+    as loaded from the file and converted to the display format
+    '''
+    import pygame
+    import assets
+    import game
+    results = {}
+    level = populated_level(engine.BitLevel)
+
+    def first_frame():
+        assets.preload()
+        assets.convert_loaded()
+        game.LevelRenderer(screen).draw(level, [])
+
+    results["assets.first_frame"] = measure(first_frame, 1, clear_assets)
+
+    for name in ("BACKGROUND", "BLOCK_BLUE"):
+        loaded = pygame.image.load(assets.IMAGE_PATHS[name])
+        converted = assets.get_image(name)
+        number = 200 if name == "BACKGROUND" else 10000
+        results[f"assets.blit_{name}.loaded"] = measure(lambda: screen.blit(loaded, (0, 0)), number)
+        results[f"assets.blit_{name}.converted"] = measure(lambda: screen.blit(converted, (0, 0)), number)
+
+    return report(results)
+
+def bench_render(screen):
+    '''
+    drawLevel, drawTet and a whole LevelRenderer frame on a populated board
+    '''
+    import game
+    results = {}
+    level = populated_level(engine.BitLevel)
+    tet = level.get_tet()
+    renderer = game.LevelRenderer(screen)
+    renderer.draw(level, [])
+
+    results["render.drawLevel"] = measure(lambda: game.drawLevel(screen, level), 1000)
+    results["render.drawTet"] = measure(lambda: game.drawTet(screen, tet), 10000)
+    results["render.LevelRenderer.draw"] = measure(lambda: renderer.draw(level, []), 1000)
+    results["render.LevelRenderer.draw_rebuild"] = measure(lambda: renderer.draw(level, []), 200, renderer.invalidate)
+
+    return report(results)
+
+def build_menu(size):
+    import gui
+    import assets
+    menu = gui.Container(engine.LEVEL_W // 2, engine.LEVEL_H // 2) \
+    .add_child(gui.Text("Benchmark", assets.get_font(50)))
+    for i in range(size):
+        menu.add_child(gui.Button(gui.Text(f"button {i}", assets.get_font(35))))
+    menu.update()
+    return menu
+
+def bench_gui(screen):
+    '''
+    layout and drawing of menus with MENU_SIZES buttons
+    '''
+    import pygame
+    results = {}
+    event = pygame.event.Event(pygame.KEYDOWN, key=pygame.K_x, unicode="x") # not a navigation key
+    for size in MENU_SIZES:
+        name = f"gui.Container[{size}]"
+        menu = build_menu(size)
+        number = max(10, 2000 // size)
+
+        results[name + ".update"] = measure(menu.update, number * 10)
+        results[name + ".update_relayout"] = measure(menu.update, number, menu.invalidate)
+        menu.update()
+        menu.draw(screen)
+        results[name + ".draw"] = measure(lambda: menu.draw(screen), number)
+        results[name + ".draw_uncached"] = measure(lambda: menu.draw_uncached(screen), number)
+        menu.update_selected(1)
+        results[name + ".input"] = measure(lambda: menu.input(event), number * 10)
+
+    return report(results)
+
+def bench_present():
+    '''
+    Display.present of a typical frame (falling tet and a text changed) and of a whole frame per window size,
+    the fractional size is measured with and without smoothscale
+    '''
+    import pygame
+    import display
+    results = {}
+    dirty = [pygame.Rect(160, 280, 120, 120), pygame.Rect(0, 0, 200, 40)]
+    for size in WINDOW_SIZES:
+        for smooth in (False, True):
+            window = display.Display(size, smooth, integer_scale=False)
+            if smooth and window.get_scale() == int(window.get_scale()):
+                continue # whole number scales never use smoothscale
+            name = f"display.present[{size[0]}x{size[1]}{',smooth' if smooth else ''}]"
+            window.present()
+            results[name + ".dirty"] = measure(lambda: window.present(dirty), 200)
+            results[name + ".full"] = measure(window.present, 50)
+    pygame.display.set_mode((engine.LEVEL_W, engine.LEVEL_H))
+    return report(results)
+
+def bench_audio():
+    '''
+    SoundPool.play for drop sounds and bursts of line clears mixed with drops,
+    "missed" counts clear and difficulty sounds that were not played and has to stay 0
+    '''
+    import audio
+    results = {}
+    pool = audio.SoundPool()
+    if not pool.channels:
+        print("no mixer, skipping audio benchmark")
+        return results
+
+    results["audio.play_drop"] = measure(lambda: pool.play("DROP"), 10000)
+    names = ["CLEAR4", "CLEAR3", "DROP", "CLEAR2", "DIFFICULTY_UP", "DROP", "CLEAR1", "CLEAR4"]
+    missed = [0] # clear and difficulty sounds that were not played
+    def burst():
+        for name in names:
+            if not pool.play(name, time.perf_counter()) and name != "DROP":
+                missed[0] += 1
+    pool = audio.SoundPool()
+    results["audio.clear_burst"] = measure(burst, 1000)
+    results["audio.stats"] = dict(pool.get_stats(), missed=missed[0])
+    pool.stop()
+
+    return report(results)
+
+def bench_file_handler():
+    '''
+    FileHandler load, save (compaction) and score appends with SCORE_COUNTS scores
+    '''
+    import game
+    from scores import ScoreIndex
+    results = {}
+    rng = random.Random(0)
+
+    for count in SCORE_COUNTS:
+        name = f"files.FileHandler[{count}]"
+        number = max(1, 100000 // count)
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, "data")
+
+        handler = game.FileHandler(path, compact_after=1 << 62)
+        handler.add_setting_to_data("fps", "60")
+        scores = [(f"player{i}", rng.randrange(100000)) for i in range(count)]
+        scores.sort(key=lambda element: -element[1])
+        handler.score_index = ScoreIndex(scores)
+        handler.write_data_to_file()
+
+        results[name + ".load"] = measure(lambda: game.FileHandler(path), number)
+        results[name + ".save"] = measure(handler.write_data_to_file, number)
+        results[name + ".add_score"] = measure(lambda: handler.add_score_to_data("player", rng.randrange(100000)), 100)
+
+        directory.cleanup()
+
+    return report(results)
+
+def run_all():
+    results = {}
+    results.update(bench_placements())
+    try:
+        import numpy
+    except ImportError:
+        print("numpy not installed, skipping batch benchmark")
+    else:
+        results.update(bench_batch())
+    if os.path.exists("last_game.replay"):
+        results.update(bench_replay())
+    results.update(bench_snapshot())
+
+    results.update(bench_engine(engine.Level))
+    results.update(bench_engine(engine.BitLevel))
+
+    screen = init_display()
+    results.update(bench_assets(screen))
+    results.update(bench_render(screen))
+    results.update(bench_gui(screen))
+    results.update(bench_present())
+    results.update(bench_audio())
+    results.update(bench_file_handler())
+    return results
+
+def compare(old_path, new_path, threshold=1.1):
+    '''
+    prints the results of two result files side by side, returns the amount of measurements that got
+    worse by more than threshold: times and sizes that grew, throughputs that shrank by that factor
+    '''
+    file = open(old_path, "r")
+    old = json.load(file)["results"]
+    file.close()
+    file = open(new_path, "r")
+    new = json.load(file)["results"]
+    file.close()
+
+    regressions = 0
+    for name, result in new.items():
+        if name not in old:
+            continue
+        for key, (unit, direction) in COMPARED.items():
+            if key not in result or key not in old[name] or not result[key] or not old[name][key]:
+                continue
+            ratio = (result[key] / old[name][key]) ** direction # > 1 is worse
+            flag = ""
+            if ratio > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{name:40} {old[name][key]:12.2f} -> {result[key]:12.2f} {unit:2}  {ratio:5.2f}x{flag}")
+    return regressions
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--compare":
+        sys.exit(1 if compare(sys.argv[2], sys.argv[3]) else 0)
+
+    output = sys.argv[1] if len(sys.argv) > 1 else "benchmark.json"
+    results = run_all()
+
+    import pygame
+    file = open(output, "w")
+    json.dump({"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "python": platform.python_version(),
+               "pygame": pygame.version.ver,
+               "platform": platform.platform(),
+               "results": results}, file, indent=1)
+    file.close()
+    print(f"results written to {output}")
@@ -0,0 +1,89 @@
+'''
+input routing. events are stamped with the time they were polled at and every event goes to exactly
+one receiver: a global action, the focused gui element or the gameplay action handler.
+keys are looked up in key -> action tables instead of being compared one by one.
+
+held move keys repeat (DAS) on their own clock: repeats are due at fixed times after the key press,
+no matter how long the frames in between took.
+'''
+
+import time
+import pygame
+
+DAS_DELAY = 0.17 # seconds a move key has to be held until it starts repeating
+DAS_RATE = 0.05 # seconds between repeats
+
+class AutoRepeat:
+    '''
+    repeats the action of the most recently pressed key until it is released
+    '''
+    def __init__(self, delay=DAS_DELAY, rate=DAS_RATE):
+        self.delay = delay
+        self.rate = rate
+        self.action = False # action being repeated, False if no key is held
+        self.pressed_at = 0
+        self.repeats = 0 # repeats returned by get_due since the key was pressed
+
+    def press(self, action, timestamp):
+        self.action = action
+        self.pressed_at = timestamp
+        self.repeats = 0
+        return self
+
+    def release(self, action=None):
+        '''
+        stops repeating, only if action is the one being repeated unless action is None
+        '''
+        if action is None or action == self.action:
+            self.action = False
+        return self
+
+    def get_due(self, now):
+        '''
+        returns the times of the repeats that are due until now and were not returned before
+        '''
+        if self.action == False or now < self.pressed_at + self.delay:
+            return []
+        due = int((now - self.pressed_at - self.delay) / self.rate) + 1
+        times = [self.pressed_at + self.delay + i * self.rate for i in range(self.repeats, due)]
+        self.repeats = due
+        return times
+
+class InputRouter:
+    '''
+    global_actions and key_actions map keys to action names. on_global(action, timestamp) is called for
+    key presses of global_actions in every state, on_action(action, pressed, timestamp) for presses and
+    releases of key_actions while no element has the focus. everything else goes to the focused element
+    '''
+    def __init__(self, global_actions, key_actions, on_global, on_action, gui_keys):
+        self.global_actions = global_actions
+        self.key_actions = key_actions
+        self.on_global = on_global
+        self.on_action = on_action
+        self.gui_keys = gui_keys # (up, down, action) keys passed to Element.input
+        self.focus = False # element that gets the events, False = gameplay
+
+    def set_focus(self, element):
+        self.focus = element
+        return self
+
+    def get_focus(self):
+        return self.focus
+
+    def poll(self):
+        '''
+        returns the pending events as (timestamp, event)
+        '''
+        events = pygame.event.get()
+        now = time.perf_counter()
+        return [(now, event) for event in events]
+
+    def route(self, timestamp, event):
+        if event.type == pygame.KEYDOWN and event.key in self.global_actions:
+            self.on_global(self.global_actions[event.key], timestamp)
+        elif self.focus != False:
+            self.focus.input(event, *self.gui_keys)
+        elif event.type == pygame.KEYDOWN or event.type == pygame.KEYUP:
+            action = self.key_actions.get(event.key)
+            if action is not None:
+                self.on_action(action, event.type == pygame.KEYDOWN, timestamp)
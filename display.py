@@ -0,0 +1,90 @@
+'''
+everything is drawn to surface, a fixed LEVEL_W x LEVEL_H logical screen, the gui and level coordinates
+are logical pixels. present() scales the changed areas to the window once per frame:
+    - at scale 1 the dirty rects are copied to the window
+    - at whole number scales every dirty rect is scaled on its own (nearest neighbour is exact there),
+      so the cost follows the changed area and not the window size
+    - other scales scale the whole frame, with smoothscale if smooth is set
+the logical screen is centered in the window, the rest is black.
+'''
+
+import pygame
+from engine import LEVEL_W, LEVEL_H
+
+class Display:
+    def __init__(self, window_size=(LEVEL_W, LEVEL_H), smooth=False, integer_scale=True, flags=pygame.RESIZABLE):
+        '''
+        integer_scale: only use whole number scales if the window is at least as big as the logical screen,
+        pixels stay sharp and dirty rect scaling can be used, the border gets wider
+        '''
+        self.logical_size = (LEVEL_W, LEVEL_H)
+        self.smooth = smooth
+        self.integer_scale = integer_scale
+        self.flags = flags
+        self.window = pygame.display.set_mode(window_size, flags)
+        self.surface = pygame.Surface(self.logical_size).convert() # logical screen, draw here
+        self.scale = 1
+        self.target = False # rect of the window the logical screen is shown in
+        self.full_update = True # next present fills the border and updates the whole window
+        self.resize(window_size)
+
+    def resize(self, window_size):
+        '''
+        sets the window size and recalculates the scale, the next present updates the whole window
+        '''
+        self.window = pygame.display.get_surface() # resizing the window by hand replaces it
+        if self.window.get_size() != tuple(window_size):
+            self.window = pygame.display.set_mode(window_size, self.flags)
+        window_w, window_h = self.window.get_size()
+        logical_w, logical_h = self.logical_size
+
+        scale = min(window_w / logical_w, window_h / logical_h)
+        if self.integer_scale and scale >= 1:
+            scale = int(scale)
+        self.scale = scale
+        self.target = pygame.Rect(0, 0, int(logical_w * scale), int(logical_h * scale))
+        self.target.center = (window_w // 2, window_h // 2)
+        self.full_update = True
+        return self
+
+    def get_surface(self):
+        return self.surface
+
+    def get_scale(self):
+        return self.scale
+
+    def present(self, dirty=None):
+        '''
+        shows the logical rects in dirty (all of the logical screen if None) in the window
+        '''
+        if dirty is None or self.full_update:
+            dirty = [self.surface.get_rect()]
+        if self.full_update:
+            self.window.fill((0, 0, 0))
+        scale = self.scale
+
+        if scale == 1:
+            rects = []
+            for rect in dirty:
+                rects.append(self.window.blit(self.surface, rect.move(self.target.topleft), rect))
+        elif scale == int(scale):
+            rects = []
+            bounds = self.surface.get_rect()
+            for rect in dirty:
+                rect = rect.clip(bounds)
+                if rect.w == 0 or rect.h == 0:
+                    continue
+                target = pygame.Rect(self.target.x + rect.x * scale, self.target.y + rect.y * scale, rect.w * scale, rect.h * scale)
+                pygame.transform.scale(self.surface.subsurface(rect), target.size, self.window.subsurface(target))
+                rects.append(target)
+        else:
+            if self.smooth:
+                pygame.transform.smoothscale(self.surface, self.target.size, self.window.subsurface(self.target))
+            else:
+                pygame.transform.scale(self.surface, self.target.size, self.window.subsurface(self.target))
+            rects = [self.target]
+
+        if self.full_update:
+            rects = [self.window.get_rect()]
+            self.full_update = False
+        pygame.display.update(rects)
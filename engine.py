@@ -0,0 +1,557 @@
+'''
+pure python game rules. no pygame in here so levels can be simulated headless,
+sound and rendering are attached from the outside through hooks (see Level.add_hook)
+'''
+
+import random
+
+GRID_SIZE = 40
+LEVEL_W = GRID_SIZE * 10
+LEVEL_H = GRID_SIZE * 20
+
+FULL_ROW = (1 << 10) - 1 # bitmask of a row with all 10 columns filled
+
+SOUNDS = ("DROP",
+          "CLEAR1",
+          "CLEAR2",
+          "CLEAR3",
+          "CLEAR4",
+          "DIFFICULTY_UP") # sound played for: 0 lines cleared, 1 line cleared... 4 lines cleared, difficulty up
+
+def get_rotations(piece):
+    result = [piece]
+    result.append(list (map(lambda x: (-x[1], x[0]),piece)))
+    result.append(list (map(lambda x: (-x[0], -x[1]),piece)))
+    result.append(list (map(lambda x: (x[1], -x[0]),piece)))
+    return result
+
+all_pieces = [[[(0,0), (-1,0), (1,0), (-2,0)],
+              [(0,0), (0,-1), (0,2), (0,1)]], # I
+              get_rotations([(0,0), (-1,0), (-1,-1), (1,0)]), # J
+              get_rotations([(0,0), (-1,0), (1,0), (-1,1)]), # L
+              [[(0,0), (0,1), (-1,0), (-1,1)]], # O
+              [[(0,0), (-1,0), (-1,-1), (0,1)],
+               [(0,0), (0,-1), (1, -1), (-1,0)]], # S
+              [[(0,0), (-1,-1), (1,0), (0,-1)],
+               [(0,0), (1,-1), (0, 1), (1,0)]], # Z
+              get_rotations([(0,0), (0,-1), (1,0), (-1,0)])] # T
+
+class Shape:
+    '''
+    precomputed data of one rotation of a piece, positions are in grid cells relative to the piece origin
+    '''
+    def __init__(self, cells):
+        self.cells = tuple(cells)
+        self.min_x = min(map(lambda c: c[0], cells))
+        self.max_x = max(map(lambda c: c[0], cells))
+        self.min_y = min(map(lambda c: c[1], cells))
+        self.max_y = max(map(lambda c: c[1], cells))
+        self.col_min = -self.min_x # lowest grid column the origin can be in
+        self.col_max = 9 - self.max_x # highest grid column the origin can be in
+        self.row_max = 20 - self.max_y # lowest grid row the origin can be in
+
+        # row masks are relative to min_x, a piece at grid column x covers (mask << (x + min_x)) in row y + dy
+        rows = {}
+        for c in cells:
+            rows[c[1]] = rows.get(c[1], 0) | (1 << (c[0] - self.min_x))
+        self.masks = tuple(sorted(rows.items()))
+
+        # (dx, lowest dy) of every column of the shape, the cells the shape lands on
+        bottoms = {}
+        for c in cells:
+            bottoms[c[0]] = max(bottoms.get(c[0], c[1]), c[1])
+        self.bottoms = tuple(sorted(bottoms.items()))
+
+_piece_shapes = {} # piece (tuple of rotations) -> list of Shape per rotation
+
+def get_shapes(piece):
+    '''
+    returns the Shape of every rotation of piece, only computed once per piece
+    '''
+    key = tuple(map(tuple, piece))
+    if key not in _piece_shapes:
+        _piece_shapes[key] = [Shape(rotation) for rotation in piece]
+    return _piece_shapes[key]
+
+piece_table = [get_shapes(piece) for piece in all_pieces] # indexed by [piece][rotation]
+piece_index = {id(shapes): index for index, shapes in enumerate(piece_table)} # Tet.shapes -> index into piece_table
+
+'''
+compact encodings shared by snapshot.py and spectator.py
+'''
+X_OFF = 3 # added to a tet x that is stored unsigned, so it is never negative
+MAP_BYTES = 21 * 10 // 2 # size of a map packed by pack_map
+
+def pack_map(level_map, out):
+    '''
+    appends the cell colours of level_map to the bytearray out, 4 bits per cell
+    '''
+    for row in level_map:
+        for x in range(0, 10, 2):
+            out.append(row[x] | row[x + 1] << 4)
+    return out
+
+def unpack_map(data, pos):
+    '''
+    returns the map packed by pack_map at data[pos:pos + MAP_BYTES], raises IndexError if data is too short
+    '''
+    cells = data[pos:pos + MAP_BYTES]
+    if len(cells) < MAP_BYTES:
+        raise IndexError("packed map is truncated")
+    return [[cells[y * 5 + x // 2] >> (x % 2 * 4) & 15 for x in range(10)] for y in range(21)]
+
+class Tet:
+    dropping = False
+
+    def __init__(self
+                 ,level
+                 ,x=LEVEL_W//2
+                 ,y=GRID_SIZE
+                 ,piece=None
+                 ,tpf=2):
+        '''
+        piece defaults to a random piece from the rng of level
+        '''
+        if piece is None:
+            piece = all_pieces[level.rng.randint(0,6)]
+        self.piece_w_rot = piece.copy()
+        self.shapes = get_shapes(piece)
+        self.grid_x = x // GRID_SIZE
+        self.grid_y = y // GRID_SIZE
+        self.level = level
+        self.color = level.rng.randint(1,7)
+        self.dropping = False
+        self.rot_index = 0
+        self.tpf = tpf
+        self.tpf_adjusted = self.tpf * self.level.get_difficulty() // 1.4
+        self.dropping_tpf = self.tpf_adjusted * 10 # how many ticks until update per frame if drop key is held
+        self.current_tick = 0
+        self.move_on_tick = 100 # block moves down on move_on_tick.
+
+    def tick(self):
+        '''
+        increases current_tick by tpf on each call.
+        returns True if current_tick reached move_on_tick and sets current_tick to 0. Otherwise False
+        '''
+        if self.current_tick >= self.move_on_tick:
+            self.current_tick = 0
+            return True
+        elif self.dropping:
+            self.current_tick += self.dropping_tpf 
+            return False
+        else:
+            self.current_tick += self.tpf_adjusted
+            return False
+
+    def update(self):
+        if self.tick():
+            self.tpf_adjusted = self.tpf * self.level.get_difficulty() // 1.4
+            self.dropping_tpf = self.tpf_adjusted * 10
+            if self.dropping_tpf < 30:
+                self.dropping_tpf = 30
+
+            if self.level.collides(0, 1): # would collide with another piece on grid or bottom
+                self.level.assimilate()
+                return
+            self.grid_y += 1
+
+    def move_r(self):
+        if not self.level.collides(1):
+            self.grid_x += 1
+
+    def move_l(self):
+        if not self.level.collides(-1):
+            self.grid_x -= 1
+
+    def rotate(self):
+        if self.rot_index < len(self.piece_w_rot) - 1:
+            self.rot_index += 1
+        else:
+            self.rot_index = 0
+
+    def try_rotate(self):
+        '''
+        tries to rotate the piece, if doing so would cause it to occupy a space that is already occupied
+        then it won't rotate
+        '''
+        rot = self.rot_index + 1
+        if rot >= len(self.shapes):
+            rot = 0
+        if not self.level.collides(0, 0, rot):
+            self.rot_index = rot
+
+    x = property(lambda self: self.grid_x * GRID_SIZE, lambda self, x: self.set_x(x)) # in pixels
+    y = property(lambda self: self.grid_y * GRID_SIZE, lambda self, y: self.set_y(y)) # in pixels
+
+    def get_x(self):
+        return self.grid_x * GRID_SIZE
+
+    def get_y(self):
+        return self.grid_y * GRID_SIZE
+
+    def set_x(self, x):
+        self.grid_x = x // GRID_SIZE
+
+    def set_y(self, y):
+        self.grid_y = y // GRID_SIZE
+
+    def get_grid_x(self):
+        return self.grid_x
+
+    def get_grid_y(self):
+        return self.grid_y
+
+    def get_shape(self):
+        return self.shapes[self.rot_index]
+
+    def getPiece(self):
+        return self.piece_w_rot.copy()
+
+    def setPiece(self, piece):
+        self.piece_w_rot = piece
+        self.shapes = get_shapes(piece)
+
+    def getRotIndex(self):
+        return self.rot_index
+
+    def setRotIndex(self, index):
+        self.rot_index = index
+
+    def get_color(self):
+        return self.color
+
+    def set_dropping(self, drop):
+        self.dropping = drop
+
+    def hard_drop(self):
+        '''
+        moves the piece straight down to where it would land and places it
+        '''
+        self.grid_y = self.level.get_drop_y()
+        self.level.assimilate()
+
+class Level:
+    tet = 0
+    score_base = (1, 100, 300, 500, 800) # reward at difficulty 1 for: placed block, 1 line cleared, 2 lines cleared... 4 lines cleared
+
+    def __init__(self, seed=None):
+        '''
+        all randomness of the level comes from its own rng, so the same seed and the same inputs
+        on the same frames always play out the same game
+        '''
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.map = [[0 for i in range(10)] for j in range(21)]
+        self.skyline = [21 for i in range(10)] # highest occupied row of every column, ignoring row 0. 21 = empty column
+        self.hooks = {} # dict containing event name and list of functions called on that event
+        self.score = 0
+        self.frame = 0 # amount of updates done
+        self.difficulty = 1 # increases over time
+        self.difficulty_stage = 0 # current stage until difficulty increase
+        self.difficulty_increase_on_stage = 20 # difficulty increases upon reaching this number
+        self.max_difficulty = 20
+        self.score_rewards = tuple(reward * self.difficulty for reward in self.score_base)
+        self.tet = Tet(self)
+
+    def get_map(self):
+        return self.map.copy()
+
+    def get_tet(self):
+        return self.tet
+
+    def get_difficulty(self):
+        return self.difficulty
+
+    def set_difficulty(self, difficulty):
+        self.difficulty = difficulty
+        self.score_rewards = tuple(reward * self.difficulty for reward in self.score_base)
+
+    def get_score_rewards(self):
+        return self.score_rewards
+
+    def get_score(self):
+        return self.score
+
+    def get_seed(self):
+        return self.seed
+
+    def get_frame(self):
+        return self.frame
+
+    def add_hook(self, event, fun):
+        '''
+        fun gets called with the event arguments whenever the level emits event.
+        events:
+        "score": (reward) after a piece has been placed, get_score() already includes reward
+        "lines": (lines cleared) after a piece has been placed that cleared at least one line
+        "sound": (sound name from SOUNDS) after a piece has been placed
+        "locked": () after a piece has been placed and the next piece spawned, map has changed
+        "difficulty": (new difficulty) when the difficulty increased
+        "game_over": () after a piece has been placed that ended the game
+        "updated": () at the end of every update
+        '''
+        if event not in self.hooks:
+            self.hooks[event] = []
+        self.hooks[event].append(fun)
+        return self
+
+    def remove_hook(self, event, fun):
+        if event in self.hooks and fun in self.hooks[event]:
+            self.hooks[event].remove(fun)
+        return self
+
+    def emit(self, event, *args):
+        if event in self.hooks:
+            for fun in self.hooks[event]:
+                fun(*args)
+
+    def update(self):
+        self.update_difficulty()
+        self.frame += 1
+        self.tet.update()
+        if "updated" in self.hooks:
+            self.emit("updated")
+
+    def update_difficulty(self):
+        '''
+        increases the difficulty once enough lines have been cleared on the current one
+        '''
+        if self.difficulty_stage >= self.difficulty_increase_on_stage and not self.difficulty >= self.max_difficulty:
+            self.set_difficulty(self.difficulty + 1)
+            self.difficulty_stage = 0
+            self.emit("difficulty", self.difficulty)
+
+    def assimilate(self):
+        self.lock_tet()
+        tet = self.tet
+        for pr in tet.shapes[tet.rot_index].cells:
+            x = tet.grid_x + pr[0]
+            y = tet.grid_y + pr[1]
+            if y >= 1 and y < self.skyline[x]:
+                self.skyline[x] = y
+        self.clear_lines()
+        self.tet = Tet(self)
+        self.emit("locked")
+        if self.check_game_over():
+            self.emit("game_over")
+
+    def lock_tet(self):
+        '''
+        writes the cells of the current tet into the map
+        '''
+        tet = self.tet
+        for pr in tet.shapes[tet.rot_index].cells:
+            self.map[tet.grid_y + pr[1]][tet.grid_x + pr[0]] = tet.color
+
+    def get_drop_y(self):
+        '''
+        grid row the current tet would land on if it fell straight down.
+        uses the skyline for the columns of the tet, only steps down row by row if the tet is
+        already below the top of one of its columns (e.g. moved under an overhang)
+        '''
+        tet = self.tet
+        shape = tet.shapes[tet.rot_index]
+        y = tet.grid_y
+        drop_y = shape.row_max
+        below_top = False
+        for dx, dy in shape.bottoms:
+            top = self.skyline[tet.grid_x + dx]
+            if y + dy >= top:
+                below_top = True
+                break
+            if top - 1 - dy < drop_y:
+                drop_y = top - 1 - dy
+
+        if below_top or self.collides(0, drop_y - y):
+            drop_y = y
+            while not self.collides(0, drop_y - y + 1):
+                drop_y += 1
+        return drop_y
+
+    def get_rows(self):
+        '''
+        row bitmasks of the settled blocks (bit x set = column x occupied), see BitLevel
+        '''
+        return [sum(1 << x for x, cell in enumerate(row) if cell != 0) for row in self.map]
+
+    def rebuild_from_map(self):
+        '''
+        has to be called after the map was changed from the outside, recalculates everything derived from it
+        '''
+        return self.rebuild_skyline()
+
+    def rebuild_skyline(self):
+        '''
+        recalculates the skyline from the map
+        '''
+        for x in range(10):
+            self.skyline[x] = 21
+            for y in range(1, 21):
+                if self.map[y][x] != 0:
+                    self.skyline[x] = y
+                    break
+        return self
+
+    def occupied(self, x_off=0, y_off=0):
+        tet = self.tet
+        for pr in tet.shapes[tet.rot_index].cells:
+            y = tet.grid_y + pr[1] + y_off
+            x = tet.grid_x + pr[0] + x_off
+
+            if x >= 0 and x < 10 and y < 21 and self.map[y][x] != 0:
+                return True
+        return False
+
+    def oob(self, x_off=0, y_off=0): #out of bounds
+        tet = self.tet
+        shape = tet.shapes[tet.rot_index]
+        x = tet.grid_x + x_off
+        return x < shape.col_min or x > shape.col_max or tet.grid_y + y_off > shape.row_max
+
+    def collides(self, x_off=0, y_off=0, rot=None):
+        '''
+        same as occupied() or oob() in a single pass.
+        rot is the rotation index to check, defaults to the current rotation of the tet
+        '''
+        tet = self.tet
+        shape = tet.shapes[tet.rot_index if rot is None else rot]
+        x = tet.grid_x + x_off
+        y = tet.grid_y + y_off
+        if x < shape.col_min or x > shape.col_max or y > shape.row_max:
+            return True
+        for pr in shape.cells:
+            if self.map[y + pr[1]][x + pr[0]] != 0:
+                return True
+        return False
+
+
+    def clear_lines(self):
+        lines_cleared = 0
+        for row_index, row in enumerate(self.map):
+            filled = True
+            for element in row:
+                if element == 0:
+                    filled = False
+
+            if filled:
+                for element_index, element in enumerate(self.map[row_index]):
+                    self.map[row_index][element_index] = 0
+
+                self.push_lines(row_index)
+                lines_cleared += 1
+
+        self.reward_lines(lines_cleared)
+
+    def reward_lines(self, lines_cleared):
+        '''
+        adds score and difficulty progress for a placed piece that cleared lines_cleared lines
+        '''
+        self.score += self.score_rewards[lines_cleared]
+        self.emit("score", self.score_rewards[lines_cleared])
+        if lines_cleared > 0:
+            self.emit("lines", lines_cleared)
+
+        self.difficulty_stage += lines_cleared # add 1 to difficulty stage per line cleared
+        '''
+        Play sound based on amount of lines cleared
+        '''
+        if self.difficulty_stage >= self.difficulty_increase_on_stage:
+            self.emit("sound", SOUNDS[5])
+        else:
+            self.emit("sound", SOUNDS[lines_cleared])
+
+    def push_lines(self, row_index):
+        del self.map[row_index]
+        self.map.insert(1, [0 for i in range(10)])
+
+        '''
+        rows between 1 and row_index moved down by one, columns whose top was the cleared row
+        get their next block below it as new top
+        '''
+        if row_index < 1:
+            self.rebuild_skyline()
+            return
+        for x in range(10):
+            top = self.skyline[x]
+            if top < row_index:
+                self.skyline[x] = top + 1
+            elif top == row_index:
+                top = row_index + 1
+                while top < 21 and self.map[top][x] == 0:
+                    top += 1
+                self.skyline[x] = top
+
+    def check_game_over(self):
+        return 1 in self.skyline
+
+
+class BitLevel(Level):
+    '''
+    Level where every row is also stored as an int bitmask (bit x set = column x occupied).
+    collision and line checks only look at the bitmasks, map is kept as a colour plane
+    for the renderer so BitLevel can be used everywhere a Level is.
+    '''
+    def __init__(self, seed=None):
+        self.rows = [0 for j in range(21)]
+        super().__init__(seed)
+
+    def get_rows(self):
+        return self.rows.copy()
+
+    def rebuild_from_map(self):
+        self.rows = super().get_rows()
+        return self.rebuild_skyline()
+
+    def lock_tet(self):
+        tet = self.tet
+        x = tet.grid_x
+        y = tet.grid_y
+        color = tet.color
+        for pr in tet.shapes[tet.rot_index].cells:
+            self.map[y + pr[1]][x + pr[0]] = color
+            self.rows[y + pr[1]] |= 1 << (x + pr[0])
+
+    def occupied(self, x_off=0, y_off=0):
+        tet = self.tet
+        shape = tet.shapes[tet.rot_index]
+        shift = tet.grid_x + x_off + shape.min_x
+        y = tet.grid_y + y_off
+        for dy, mask in shape.masks:
+            if y + dy < 21:
+                if shift >= 0:
+                    mask = (mask << shift) & FULL_ROW
+                else:
+                    mask = mask >> -shift
+                if self.rows[y + dy] & mask:
+                    return True
+        return False
+
+    def collides(self, x_off=0, y_off=0, rot=None):
+        tet = self.tet
+        shape = tet.shapes[tet.rot_index if rot is None else rot]
+        x = tet.grid_x + x_off
+        y = tet.grid_y + y_off
+        if x < shape.col_min or x > shape.col_max or y > shape.row_max:
+            return True
+        shift = x + shape.min_x
+        rows = self.rows
+        for dy, mask in shape.masks:
+            if rows[y + dy] & (mask << shift):
+                return True
+        return False
+
+    def clear_lines(self):
+        lines_cleared = 0
+        for row_index, row in enumerate(self.rows):
+            if row == FULL_ROW:
+                self.push_lines(row_index)
+                lines_cleared += 1
+
+        self.reward_lines(lines_cleared)
+
+    def push_lines(self, row_index):
+        del self.rows[row_index]
+        self.rows.insert(1, 0)
+        super().push_lines(row_index)
@@ -1,343 +1,163 @@
 #!/usr/bin/python3
 
 import pygame
-import random
 import sys
 import os
+import time
 import gui
+import audio
+import display
+import replay
+import snapshot
+import assets
+import profiler
+import controls
+from scores import ScoreIndex
 from enum import Enum
-
-GRID_SIZE = 40
-LEVEL_W = GRID_SIZE * 10
-LEVEL_H = GRID_SIZE * 20
-
-pygame.font.init()
-pygame.mixer.init()
-
-FONT_PIXEL_25 = pygame.font.Font(os.path.join("assets", "fonts", "Pixel.ttf"), 25)
-FONT_PIXEL_35 = pygame.font.Font(os.path.join("assets", "fonts", "Pixel.ttf"), 35)
-FONT_PIXEL_50 = pygame.font.Font(os.path.join("assets", "fonts", "Pixel.ttf"), 50)
-
-IMG_BLOCK_BLUE = pygame.image.load(os.path.join("assets", "block_blue.png"))
-IMG_BLOCK_CYAN = pygame.image.load(os.path.join("assets", "block_cyan.png"))
-IMG_BLOCK_GREEN = pygame.image.load(os.path.join("assets", "block_green.png"))
-IMG_BLOCK_ORANGE = pygame.image.load(os.path.join("assets", "block_orange.png"))
-IMG_BLOCK_PURPLE = pygame.image.load(os.path.join("assets", "block_purple.png"))
-IMG_BLOCK_RED = pygame.image.load(os.path.join("assets", "block_red.png"))
-IMG_BLOCK_YELLOW = pygame.image.load(os.path.join("assets", "block_yellow.png"))
-
-IMG_BACKGROUND = pygame.image.load(os.path.join("assets", "cathedral.jpg"))
-
-BLOCK_IMGS = [False,
-              IMG_BLOCK_BLUE,
-              IMG_BLOCK_CYAN,
-              IMG_BLOCK_GREEN,
-              IMG_BLOCK_ORANGE,
-              IMG_BLOCK_PURPLE,
-              IMG_BLOCK_RED,
-              IMG_BLOCK_YELLOW]
+from collections import OrderedDict
+from engine import GRID_SIZE, LEVEL_W, LEVEL_H, BitLevel, piece_table
 
 KEYBINDS = {"MOVE_L": pygame.K_a,
             "MOVE_R": pygame.K_d,
             "ROTATE": pygame.K_SPACE,
             "DROP": pygame.K_s,
+            "HARD_DROP": pygame.K_w,
             "PAUSE": pygame.K_ESCAPE,
             "GUI_UP": pygame.K_w,
             "GUI_DOWN": pygame.K_s,
-            "GUI_ACTION": pygame.K_RETURN}
-
-SFX = {"DROP":   pygame.mixer.Sound(os.path.join("assets", "sfx", "drop.wav")),
-       "CLEAR1": pygame.mixer.Sound(os.path.join("assets", "sfx", "clear1.wav")),
-       "CLEAR2": pygame.mixer.Sound(os.path.join("assets", "sfx", "clear2.wav")),
-       "CLEAR3": pygame.mixer.Sound(os.path.join("assets", "sfx", "clear3.wav")),
-       "CLEAR4": pygame.mixer.Sound(os.path.join("assets", "sfx", "clear4.wav")),
-       "DIFFICULTY_UP": pygame.mixer.Sound(os.path.join("assets", "sfx", "difficulty_up.wav"))}
+            "GUI_ACTION": pygame.K_RETURN,
+            "PROFILER": pygame.K_F3,
+            "TRACE": pygame.K_F4}
+
+GLOBAL_KEYS = ("PAUSE", "PROFILER", "TRACE") # KEYBINDS handled in every state, see Game.on_global_action
+GAMEPLAY_KEYS = ("MOVE_L", "MOVE_R", "ROTATE", "DROP", "HARD_DROP") # KEYBINDS handled while playing
+PRESS_ACTIONS = {"MOVE_L": replay.ACTION_MOVE_L,
+                 "MOVE_R": replay.ACTION_MOVE_R,
+                 "ROTATE": replay.ACTION_ROTATE,
+                 "DROP": replay.ACTION_DROP_ON,
+                 "HARD_DROP": replay.ACTION_HARD_DROP} # gameplay key -> replay action done when it is pressed
+REPEATED_KEYS = ("MOVE_L", "MOVE_R") # gameplay keys that auto repeat while held
 
 MUSIC = {"TETRIS": os.path.join("assets", "music", "tetris.ogg")}
 
-def get_rotations(piece):
-    result = [piece]
-    result.append(list (map(lambda x: (-x[1], x[0]),piece)))
-    result.append(list (map(lambda x: (-x[0], -x[1]),piece)))
-    result.append(list (map(lambda x: (x[1], -x[0]),piece)))
-    return result
-
-all_pieces = [[[(0,0), (-1,0), (1,0), (-2,0)],
-              [(0,0), (0,-1), (0,2), (0,1)]], # I
-              get_rotations([(0,0), (-1,0), (-1,-1), (1,0)]), # J
-              get_rotations([(0,0), (-1,0), (1,0), (-1,1)]), # L
-              [[(0,0), (0,1), (-1,0), (-1,1)]], # O
-              [[(0,0), (-1,0), (-1,-1), (0,1)],
-               [(0,0), (0,-1), (1, -1), (-1,0)]], # S
-              [[(0,0), (-1,-1), (1,0), (0,-1)],
-               [(0,0), (1,-1), (0, 1), (1,0)]], # Z
-              get_rotations([(0,0), (0,-1), (1,0), (-1,0)])] # T
-
-class Tet:
-    dropping = False
-
-    def __init__(self
-                 ,level
-                 ,x=LEVEL_W//2
-                 ,y=GRID_SIZE
-                 ,piece=all_pieces[random.randint(0,6)]
-                 ,tpf=2):
-        self.piece_w_rot = piece.copy()
-        self.x = x
-        self.y = y
-        self.level = level
-        self.color = random.randint(1,7)
-        self.dropping = False
-        self.rot_index = 0
-        self.tpf = tpf
-        self.tpf_adjusted = self.tpf * self.level.get_difficulty() // 1.4
-        self.dropping_tpf = self.tpf_adjusted * 10 # how many ticks until update per frame if drop key is held
-        self.current_tick = 0
-        self.move_on_tick = 100 # block moves down on move_on_tick.
-
-    def tick(self):
-        '''
-        increases current_tick by tpf on each call.
-        returns True if current_tick reached move_on_tick and sets current_tick to 0. Otherwise False
-        '''
-        if self.current_tick >= self.move_on_tick:
-            self.current_tick = 0
-            return True
-        elif self.dropping:
-            self.current_tick += self.dropping_tpf 
-            return False
-        else:
-            self.current_tick += self.tpf_adjusted
-            return False
-
-    def update(self):
-        if self.tick():
-            self.tpf_adjusted = self.tpf * self.level.get_difficulty() // 1.4
-            self.dropping_tpf = self.tpf_adjusted * 10
-            if self.dropping_tpf < 30:
-                self.dropping_tpf = 30
-
-            if self.level.occupied(0, 1) or self.level.oob(0, 1): # would collide with another piece on grid or bottom
-                self.level.assimilate()
-                return
-            self.y += GRID_SIZE
-
-    def move_r(self):
-        if not self.level.occupied(1) and not self.level.oob(1):
-            self.x += GRID_SIZE
-
-    def move_l(self):
-        if not self.level.occupied(-1) and not self.level.oob(-1):
-            self.x -= GRID_SIZE
-
-    def rotate(self):
-        if self.rot_index < len(self.piece_w_rot) - 1:
-            self.rot_index += 1
-        else:
-            self.rot_index = 0
-
-    def try_rotate(self):
-        '''
-        tries to rotate the piece, if doing so would cause it to occupy a space that is already occupied
-        then it won't rotate
-        '''
-        before_rot = self.rot_index
-        self.rotate()
-        if self.level.occupied() or self.level.oob():
-            self.rot_index = before_rot
-
-    def get_x(self):
-        return self.x
-
-    def get_y(self):
-        return self.y
-
-    def set_x(self, x):
-        self.x = x
-
-    def set_y(self, y):
-        self.y = y
-
-    def getPiece(self):
-        return self.piece_w_rot.copy()
-
-    def setPiece(self, piece):
-        self.piece_w_rot = piece
-
-    def getRotIndex(self):
-        return self.rot_index
-
-    def setRotIndex(self, index):
-        self.rot_index = index
-
-    def get_color(self):
-        return self.color
-
-    def set_dropping(self, drop):
-        self.dropping = drop
-
-class Level:
-    tet = 0
-
-    def __init__(self, game):
-        self.map = [[0 for i in range(10)] for j in range(21)]
-        self.game = game
-        self.difficulty = 1 # increases over time
-        self.difficulty_stage = 0 # current stage until difficulty increase
-        self.difficulty_increase_on_stage = 20 # difficulty increases upon reaching this number
-        self.max_difficulty = 20
-        self.score_rewards = (1   * self.difficulty, 
-                              100 * self.difficulty,
-                              300 * self.difficulty, 
-                              500 * self.difficulty, 
-                              800 * self.difficulty) # reward for: placed block, 1 line cleared, 2 lines cleared... 4 lines cleared
-        self.tet = Tet(self)
-
-    def get_map(self):
-        return self.map.copy()
-
-    def get_tet(self):
-        return self.tet
-
-    def get_difficulty(self):
-        return self.difficulty
-
-    def set_difficulty(self, difficulty):
-        self.difficulty = difficulty
-
-    def get_score_rewards(self):
-        return self.score_rewards
-
-    def update(self):
-        if self.difficulty_stage >= self.difficulty_increase_on_stage and not self.difficulty >= self.max_difficulty:
-            self.difficulty += 1
-            self.difficulty_stage = 0
-            self.score_rewards = (1   * self.difficulty, 
-                                  100 * self.difficulty,
-                                  300 * self.difficulty, 
-                                  500 * self.difficulty, 
-                                  800 * self.difficulty)
-
-        self.tet.update()
-
-    def assimilate(self):
-        for pr in self.tet.getPiece()[self.tet.getRotIndex()]:
-            self.map[self.tet.get_y() // GRID_SIZE + pr[1]][self.tet.get_x() // GRID_SIZE + pr[0]] = self.tet.get_color()
-
-        self.clear_lines()
-        self.tet = Tet(self, piece=all_pieces[random.randint(0,6)])
-
-    def occupied(self, x_off=0, y_off=0):
-        for pr in self.tet.getPiece()[self.tet.getRotIndex()]:
-            y = self.tet.get_y() // GRID_SIZE + pr[1] + y_off
-            x = self.tet.get_x() // GRID_SIZE + pr[0] + x_off
-
-            if x >= 0 and x < 10 and y < 21 and self.map[y][x] != 0:
-                return True
-        return False
-
-    def oob(self, x_off=0, y_off=0): #out of bounds
-        for pr in self.tet.getPiece()[self.tet.getRotIndex()]:
-            y = self.tet.get_y() // GRID_SIZE + pr[1] + y_off
-            x = self.tet.get_x() // GRID_SIZE + pr[0] + x_off
+SPRITE_CACHE_SIZE = sum(len(shapes) for shapes in piece_table) * 7 * 2 # max amount of pre-rendered tet sprites: 19 rotations * 7 colours, normal and ghost = 266
+sprite_cache = OrderedDict() # (cells of a rotation, colour, ghost) -> (surface, anchor offset), least recently used first
+GHOST_ALPHA = 70 # opacity of the ghost piece that shows where the falling piece lands
 
-            if y >= 21 or x >= 10 or x < 0:
-                return True
+REPLAY_PATH = "last_game.replay" # replay of the last finished game, see replay.py
+SAVE_PATH = "saved_game.snapshot" # game left when quitting, resumed from the main menu, see snapshot.py
+TRACE_PATH = "trace.json" # profiler trace written when the TRACE key is pressed, see profiler.py
+OVERLAY_REFRESH = 30 # frames between profiler overlay updates
 
-        return False
-
-
-    def clear_lines(self):
-        lines_cleared = 0
-        for row_index, row in enumerate(self.map):
-            filled = True
-            for element in row:
-                if element == 0:
-                    filled = False
-
-            if filled:
-                for element_index, element in enumerate(self.map[row_index]):
-                    self.map[row_index][element_index] = 0
-
-                self.push_lines(row_index)
-                lines_cleared += 1
-
-        self.game.update_score(self.score_rewards[lines_cleared])
-
-        self.difficulty_stage += lines_cleared # add 1 to difficulty stage per line cleared
-        '''
-        Play sound based on amount of lines cleared
-        '''
-        if self.difficulty_stage >= self.difficulty_increase_on_stage:
-            sound_to_play = 5
-        else:
-            sound_to_play = lines_cleared
-
-        for element in SFX.values():
-            if sound_to_play == 0:
-                pygame.mixer.Sound.play(element)
-                break
-            else:
-                sound_to_play -= 1
-
-
-    def push_lines(self, row_index):
-        del self.map[row_index]
-        self.map.insert(1, [0 for i in range(10)])
-
-    def check_game_over(self):
-        return any(map(lambda x: x != 0, self.map[1]))
+SIM_RATE = 60 # level updates per second, the gravity speeds in Tet are tuned for this
+MAX_SIM_STEPS = 5 # max level updates per frame, if rendering falls further behind the game slows down instead
 
 class FileHandler():
-    def __init__(self, path="data"):
+    '''
+    data is kept in two files:
+    path.txt, a snapshot with the config followed by all scores sorted from highest to lowest, and
+    a journal that every new score is appended to. the journal is merged into a new snapshot
+    once it has more than compact_after records, the snapshot names the journal that belongs to it.
+    settings are not journaled, changing one writes a new snapshot, so editing path.txt by hand works.
+    '''
+    def __init__(self, path="data", compact_after=1000):
         self.path = path + ".txt"
-        self.score_data = [] # list contains tuples containing (name (str), score (int))
+        self.base_path = path
+        self.score_index = ScoreIndex() # ranked (name (str), score (int)) entries, see scores.py
         self.setting_data = {} # dict containing settings and values to set those to
+        self.generation = 0 # snapshot generation, journal is base_path.generation.journal
+        self.journal_records = 0 # records in the journal of the current generation
+        self.compact_after = compact_after
         self.parse_file_data()
 
+    def get_journal_path(self, generation=None):
+        if generation is None:
+            generation = self.generation
+        return f"{self.base_path}.{generation}.journal"
+
     def add_score_to_data(self, name, score):
         '''
-        assumes data to be sorted
-        inserts score at sorted position
+        inserts score at its ranked position and appends it to the journal
         '''
-        added = False
-        for index, element in enumerate(self.score_data):
-            if element[1] <= score:
-                self.score_data.insert(index, (name, score))
-                added = True
-                break
-        
-        if not added:
-            self.score_data.append((name, score))
-
+        name = name.replace("\n", "").replace("\r", "")
+        self.insert_score(name, score)
+        self.append_record(f"score {score} {name}")
         return self
 
+    def insert_score(self, name, score):
+        return self.score_index.add(name, score)
+
     def add_setting_to_data(self, setting, value):
         '''
-        overrides previous setting if setting already in data
+        overrides previous setting if setting already in data, see add_settings_to_data
+        '''
+        return self.add_settings_to_data({setting: value})
+
+    def add_settings_to_data(self, settings):
+        '''
+        sets every setting in the dict settings, writes a new snapshot once if any value changed
         '''
-        self.setting_data[setting] = value
+        changed = False
+        for setting, value in settings.items():
+            value = str(value) # same as when parsed from the file
+            if self.setting_data.get(setting) != value:
+                self.setting_data[setting] = value
+                changed = True
+        if changed:
+            self.write_data_to_file()
         return self
 
     def get_score_data(self):
-        return self.score_data.copy()
+        return list(self.score_index)
+
+    def get_top_scores(self, k):
+        return self.score_index.top(k)
+
+    def get_rank(self, score):
+        '''
+        rank score would get if it was added now, 1 = highest
+        '''
+        return self.score_index.rank(score)
+
+    def get_best_score(self, name):
+        '''
+        best score of name, False if name has no score
+        '''
+        return self.score_index.get_best(name)
 
     def get_setting_data(self):
         return self.setting_data.copy()
 
+    def append_record(self, record):
+        '''
+        appends a single line to the journal and compacts once the journal got too long
+        '''
+        file = open(self.get_journal_path(), "a", encoding="utf-8", newline="\n") # same bytes on every platform
+        file.write(record + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+        file.close()
+
+        self.journal_records += 1
+        if self.journal_records > self.compact_after:
+            self.write_data_to_file()
+
     def parse_file_data(self):
         '''
-        check if file exists, if it does, parse data from file
+        check if file exists, if it does, parse data from file. then apply the journal on top of it
         '''
         if os.path.exists(self.path):
             file = open(self.path, "r")
+            scores = []
 
-            print("reading config from file...")
             for line in file:
                 '''
                 parse config 
                 no duplicate settings, uses most recent value of setting found in file
                 '''
+                if line[:10] == "# journal ":
+                    self.generation = int(line[10:])
+                    continue
                 if line[0] == "#":
                     continue
                 if line[:10] == "end-config":
@@ -351,9 +171,7 @@ class FileHandler():
                 value = parsed[1].strip('\n')
 
                 self.setting_data[setting] = value
-                print(f"read '{setting}: {value}' from file")
 
-            print("reading scores from file...")
             for line in file:
                 '''
                 parse score
@@ -361,137 +179,250 @@ class FileHandler():
                 '''
                 if line[0] == "#":
                     continue
-                parsed = line.split(":", 1)
+                parsed = line.rsplit(":", 1) # names may contain ':', scores can't
                 name = parsed[0]
                 score = parsed[1].strip('\n')
                 if not score.isnumeric():
                     score = 0
-                self.score_data.append((name, int(score))) 
-                print(f"read '{name}: {score}' from file")
+                scores.append((name, int(score)))
+            file.close()
+            self.score_index = ScoreIndex(scores)
+        self.remove_old_journals()
+
+        if os.path.exists(self.get_journal_path()):
+            file = open(self.get_journal_path(), "rb")
+            journal = file.read()
+            file.close()
+
+            '''
+            a last line without newline was cut off while being written, cut it from the journal
+            so the next record does not get appended to it. the offset is in bytes, decode after cutting
+            '''
+            end = journal.rfind(b"\n") + 1
+            if end < len(journal):
+                file = open(self.get_journal_path(), "r+b")
+                file.truncate(end)
+                file.close()
+
+            for line in journal[:end].decode("utf-8").split("\n")[:-1]:
+                self.journal_records += 1
+                parsed = line.split(" ", 1)
+                if parsed[0] == "score":
+                    parsed = parsed[1].split(" ", 1)
+                    if parsed[0].isnumeric():
+                        self.insert_score(parsed[1] if len(parsed) > 1 else "", int(parsed[0]))
+
+            if self.journal_records > self.compact_after:
+                self.write_data_to_file()
+
+    def remove_old_journals(self):
+        '''
+        removes journals of generations before the snapshot's, a crash right after a new snapshot
+        was renamed into place leaves the old journal behind, its records are already in the snapshot
+        '''
+        directory, prefix = os.path.split(self.base_path + ".")
+        for name in os.listdir(directory or "."):
+            if not name.startswith(prefix) or not name.endswith(".journal"):
+                continue
+            generation = name[len(prefix):-len(".journal")]
+            if generation.isnumeric() and int(generation) < self.generation:
+                os.remove(os.path.join(directory, name))
+        return self
 
     def write_data_to_file(self):
         '''
-        open file and erase all data in it.
-        then write on each line "name:score"
+        compacts everything into a new snapshot that starts with an empty journal.
+        the snapshot is written to a temporary file and then renamed over the old one,
+        so a crash leaves either the old snapshot and journal or the new ones
         '''
-        file = open(self.path, "a")
-        file.truncate(0)
-        print("file has been cleared")
+        generation = self.generation + 1
+        file = open(self.path + ".tmp", "w")
 
+        file.write(f"# journal {generation}\n")
         file.write("# config\n") 
-        print("writing config to file...")
         for setting, value in self.setting_data.items():
             file.write(f"{setting}:{value}\n")
-            print(f"written '{setting}:{value}' to file")
         file.write("end-config\n")
-        print()
 
         file.write("# scores are assumed to be sorted from highest to lowest.\n")
-
-        print("writing scores to file...")
-        for element in self.score_data:
+        for element in self.score_index:
             file.write(f"{element[0]}:{element[1]}\n")
-            print(f"written '{element[0]}:{element[1]}' to file")
+        file.flush()
+        os.fsync(file.fileno())
         file.close()
 
+        os.replace(self.path + ".tmp", self.path)
+
+        if os.path.exists(self.get_journal_path()):
+            os.remove(self.get_journal_path())
+        self.generation = generation
+        self.journal_records = 0
+
         return self
             
 
 class Game:
 
-    def __init__(self, gui):
-        self.file_handler = FileHandler()
+    def __init__(self, gui, file_handler=None):
+        if file_handler is None:
+            file_handler = FileHandler()
+        self.file_handler = file_handler
         self.level = False
         self.gui = gui
         self.quit = False
+        self.window_size = False # new window size after the window was resized, main resizes the display
         self.score = 0
         self.game_states = Enum("game_states", ["menu", "pause", "playing", "gameover"])
         self.game_state = self.game_states.menu
+        self.router = controls.InputRouter({KEYBINDS[name]: name for name in GLOBAL_KEYS},
+                                           {KEYBINDS[name]: name for name in GAMEPLAY_KEYS},
+                                           self.on_global_action,
+                                           self.on_gameplay_action,
+                                           (KEYBINDS["GUI_UP"], KEYBINDS["GUI_DOWN"], KEYBINDS["GUI_ACTION"]))
+        self.auto_repeat = controls.AutoRepeat()
+        self.sound_pool = audio.SoundPool()
+        self.event_time = None # perf_counter time of the input or update that is being handled, for the sound latency
         self.init_state_menu()
         self.held_keys = []
         self.music_playing = False
+        self.recorder = False
+        self.sim_steps = 0 # level updates owed, fractions carry over to the next loop
+        self.fps = 60 # frames drawn per second, 0 = uncapped
         self.set_sound_volume(0.4)
         self.set_music_volume(0.4)
         self.apply_file_settings()
 
-    def loop(self):
-        if self.game_state == self.game_states.menu:
-            pass
-        elif self.game_state == self.game_states.pause:
-            pass
-        elif self.game_state == self.game_states.playing:
-            self.level.update()
-            if self.level.check_game_over():
-                self.init_state_gameover()
-
+    def loop(self, dt=1 / SIM_RATE):
+        '''
+        dt is the time in seconds since the last call, the level is updated SIM_RATE times
+        per second of dt no matter how often loop gets called.
+        input is handled before the updates, auto repeated moves are done before the update
+        that matches the time they were due at
+        '''
         self.handle_input()
-        if self.level != False:
-            self.update_difficulty_gui()
+        profiler.mark("input")
+
+        if self.game_state == self.game_states.playing:
+            self.sim_steps += dt * SIM_RATE
+            if self.sim_steps > MAX_SIM_STEPS:
+                self.sim_steps = MAX_SIM_STEPS
+            now = time.perf_counter()
+            while self.sim_steps >= 1 and self.game_state == self.game_states.playing:
+                step_due = now - (self.sim_steps - 1) / SIM_RATE
+                for due in self.auto_repeat.get_due(step_due):
+                    self.event_time = due
+                    self.do_action(PRESS_ACTIONS[self.auto_repeat.action])
+                    profiler.add_latency(time.perf_counter() - due)
+                self.event_time = step_due
+                self.level.update()
+                self.sim_steps -= 1
+        profiler.mark("update")
 
         return self.quit
 
     def handle_input(self):
-        events = pygame.event.get()
-
-        for event in events:
+        for timestamp, event in self.router.poll():
             if event.type == pygame.QUIT:
                 self.quit = True
-            '''
-            GUI Input
-            '''
-            for element in self.gui.copy().values():
-                element.input(event=event, 
-                              key_gui_up=KEYBINDS["GUI_UP"],
-                              key_gui_down=KEYBINDS["GUI_DOWN"],
-                              key_gui_action=KEYBINDS["GUI_ACTION"])
-            '''
-            Gameplay Input
-            '''
+            elif event.type == pygame.VIDEORESIZE:
+                self.window_size = event.size
+            self.router.route(timestamp, event)
+
+    def on_global_action(self, action, timestamp):
+        if action == "PROFILER":
+            profiler.toggle()
+        elif action == "TRACE":
+            profiler.export_trace(TRACE_PATH)
+        elif action == "PAUSE":
             if self.game_state == self.game_states.playing:
-                tet = self.level.get_tet()
-                '''
-                if key is pressed
-                '''
-                if event.type == pygame.KEYDOWN:
-                    if event.key == KEYBINDS["ROTATE"]:
-                        tet.try_rotate()
-                    if event.key == KEYBINDS["MOVE_L"]:
-                        tet.move_l()
-                    elif event.key == KEYBINDS["MOVE_R"]:
-                        tet.move_r()
-                    if event.key == KEYBINDS["PAUSE"]:
-                        self.init_state_pause()
-                    if event.key == KEYBINDS["DROP"]:
-                        if KEYBINDS["DROP"] not in self.held_keys:
-                            self.level.get_tet().set_dropping(True)
-                            self.held_keys.append(KEYBINDS["DROP"])
-                '''
-                if key has been released
-                '''
-                if event.type == pygame.KEYUP:
-                    if event.key == KEYBINDS["DROP"]:
-                        if KEYBINDS["DROP"] in self.held_keys:
-                            self.level.get_tet().set_dropping(False)
-                            self.held_keys.remove(KEYBINDS["DROP"])
-
+                self.init_state_pause()
             elif self.game_state == self.game_states.pause:
-                if event.type == pygame.KEYDOWN:
-                    if event.key == KEYBINDS["PAUSE"]:
-                        self.init_state_playing()
+                self.init_state_playing()
+
+    def on_gameplay_action(self, action, pressed, timestamp):
+        '''
+        action is a name of GAMEPLAY_KEYS, pressed is False if the key was released
+        '''
+        if self.game_state != self.game_states.playing:
+            return
+
+        if pressed:
+            if action == "DROP":
+                if KEYBINDS["DROP"] in self.held_keys:
+                    return
+                self.held_keys.append(KEYBINDS["DROP"])
+            self.event_time = timestamp
+            self.do_action(PRESS_ACTIONS[action])
+            profiler.add_latency(time.perf_counter() - timestamp)
+            if action in REPEATED_KEYS:
+                self.auto_repeat.press(action, timestamp)
+        elif action in REPEATED_KEYS:
+            self.auto_repeat.release(action)
+        elif action == "DROP" and KEYBINDS["DROP"] in self.held_keys:
+            self.do_action(replay.ACTION_DROP_OFF)
+            self.held_keys.remove(KEYBINDS["DROP"])
+
+    def do_action(self, action):
+        '''
+        applies a gameplay action (replay.ACTION_*) to the level and records it for the replay.
+        recorded first, a hard drop can end the game and finish the replay
+        '''
+        if self.recorder != False:
+            self.recorder.record(action)
+        replay.apply_action(self.level, action)
+
+    def save_replay(self):
+        if self.recorder != False:
+            self.recorder.finish().save(REPLAY_PATH)
+
+    def set_level(self, level):
+        self.level = level
+        self.level.add_hook("score", self.update_score)
+        self.level.add_hook("difficulty", self.update_difficulty_gui)
+        self.level.add_hook("sound", self.play_sound)
+        self.level.add_hook("game_over", self.save_replay)
+        self.level.add_hook("game_over", self.init_state_gameover)
+
+    def save_game(self):
+        '''
+        saves the running game to SAVE_PATH, called when quitting
+        '''
+        if self.level != False and self.game_state in (self.game_states.playing, self.game_states.pause):
+            snapshot.save(self.level, SAVE_PATH)
+
+    def resume_game(self):
+        '''
+        continues the game saved at SAVE_PATH. a resumed game has no replay, replays start at frame 0
+        '''
+        try:
+            level = snapshot.load(SAVE_PATH)
+        except (OSError, ValueError, IndexError):
+            level = False
+        self.discard_save()
+        if level == False:
+            self.init_state_menu()
+            return
+        self.set_level(level)
+        self.score = level.get_score()
+        self.recorder = False
+        self.init_state_playing()
+
+    def discard_save(self):
+        if os.path.exists(SAVE_PATH):
+            os.remove(SAVE_PATH)
 
     def apply_file_settings(self):
         setting_data = self.file_handler.get_setting_data()
-        changed = False
-
-        if "sound_volume" not in setting_data:
-            self.file_handler.add_setting_to_data("sound_volume", self.sound_volume)
-            changed = True
-        if "music_volume" not in setting_data:
-            self.file_handler.add_setting_to_data("music_volume", self.music_volume)
-            changed = True
 
-        if changed:
-            self.file_handler.write_data_to_file()
+        defaults = {"sound_volume": self.sound_volume,
+                    "music_volume": self.music_volume,
+                    "fps": self.fps,
+                    "audio_buffer": audio.buffer_size, # read in main, the mixer is set up before the Game
+                    "window_width": LEVEL_W, # read in main like audio_buffer
+                    "window_height": LEVEL_H,
+                    "smooth_scaling": 0}
+        missing = {setting: value for setting, value in defaults.items() if setting not in setting_data}
+        self.file_handler.add_settings_to_data(missing) # one new snapshot on the first run, nothing after
 
         for setting, value in setting_data.items():
             if setting.lower() == "sound_volume":
@@ -502,6 +433,10 @@ class Game:
                 if value.replace('.', '', 1).isnumeric():
                     self.set_music_volume(float(value))
 
+            elif setting.lower() == "fps":
+                if value.isnumeric():
+                    self.set_fps(int(value))
+
     def init_state_menu(self):
         '''
         Main Menu
@@ -509,19 +444,23 @@ class Game:
         self.gui.clear()
         self.gui["main_menu"] = gui.Container(LEVEL_W // 2,
                                               LEVEL_H // 2)
-        self.gui["main_menu"].add_child(gui.Text("pygame-tetris", FONT_PIXEL_50))
-        self.gui["main_menu"].add_child(gui.Button(gui.Text("Start Game", FONT_PIXEL_35)) \
+        self.gui["main_menu"].add_child(gui.Text("pygame-tetris", assets.get_font(50)))
+        if os.path.exists(SAVE_PATH):
+            self.gui["main_menu"].add_child(gui.Button(gui.Text("Continue", assets.get_font(35))) \
+            .set_on_click(self,self.resume_game, []))
+        self.gui["main_menu"].add_child(gui.Button(gui.Text("Start Game", assets.get_font(35))) \
         .set_on_click(self,self.init_state_playing, []))
-        self.gui["main_menu"].add_child(gui.Button(gui.Text("High Scores", FONT_PIXEL_35)) \
+        self.gui["main_menu"].add_child(gui.Button(gui.Text("High Scores", assets.get_font(35))) \
         .set_on_click(self,self.init_state_score, []))
-        self.gui["main_menu"].add_child(gui.Button(gui.Text("Quit", FONT_PIXEL_35)) \
+        self.gui["main_menu"].add_child(gui.Button(gui.Text("Quit", assets.get_font(35))) \
         .set_on_click(self,self.set_quit, []))
+        self.router.set_focus(self.gui["main_menu"])
 
     def init_state_playing(self):
         '''
         Playing
         '''
-        if not self.music_playing:
+        if not self.music_playing and pygame.mixer.get_init():
             pygame.mixer.music.load(MUSIC["TETRIS"])
             pygame.mixer.music.play(-1)
             self.music_playing = True
@@ -529,11 +468,15 @@ class Game:
         self.gui.clear()
 
         if self.level == False:
-            self.level = Level(self)
+            self.discard_save()
+            self.set_level(BitLevel())
+            self.recorder = replay.Recorder(self.level)
 
         self.update_score_gui()
         self.update_difficulty_gui()
 
+        self.sim_steps = 0
+        self.router.set_focus(False)
         self.game_state = self.game_states.playing
 
     def init_state_pause(self):
@@ -542,38 +485,44 @@ class Game:
         '''
         self.gui["pause_menu"] = gui.Container(LEVEL_W // 2, 
                                                LEVEL_H // 2) \
-        .add_child(gui.Text("Game Paused", FONT_PIXEL_50)) \
-        .add_child(gui.Text("Rewards", FONT_PIXEL_35)) \
-        .add_child(gui.Text("---------------", FONT_PIXEL_35)) \
-        .add_child(gui.Text(f"block placed: {self.level.get_score_rewards()[0]}", FONT_PIXEL_35)) \
-        .add_child(gui.Text(f"1 line cleared: {self.level.get_score_rewards()[1]}", FONT_PIXEL_35)) \
-        .add_child(gui.Text(f"2 lines cleared: {self.level.get_score_rewards()[2]}", FONT_PIXEL_35)) \
-        .add_child(gui.Text(f"3 lines cleared: {self.level.get_score_rewards()[3]}", FONT_PIXEL_35)) \
-        .add_child(gui.Text(f"4 lines cleared: {self.level.get_score_rewards()[4]}", FONT_PIXEL_35)) \
-
+        .add_child(gui.Text("Game Paused", assets.get_font(50))) \
+        .add_child(gui.Text("Rewards", assets.get_font(35))) \
+        .add_child(gui.Text("---------------", assets.get_font(35))) \
+        .add_child(gui.Text(f"block placed: {self.level.get_score_rewards()[0]}", assets.get_font(35))) \
+        .add_child(gui.Text(f"1 line cleared: {self.level.get_score_rewards()[1]}", assets.get_font(35))) \
+        .add_child(gui.Text(f"2 lines cleared: {self.level.get_score_rewards()[2]}", assets.get_font(35))) \
+        .add_child(gui.Text(f"3 lines cleared: {self.level.get_score_rewards()[3]}", assets.get_font(35))) \
+        .add_child(gui.Text(f"4 lines cleared: {self.level.get_score_rewards()[4]}", assets.get_font(35))) \
+
+        self.auto_repeat.release()
+        self.router.set_focus(self.gui["pause_menu"])
         self.game_state = self.game_states.pause
 
     def init_state_gameover(self):
         '''
         Game Over Screen
         '''
-        pygame.mixer.music.unload()
+        if pygame.mixer.get_init():
+            pygame.mixer.music.unload()
         self.music_playing = False
 
         self.gui.clear()
 
         self.gui["gameover_enter"] = gui.Container(LEVEL_W // 2,
                                                    LEVEL_H // 2) \
-        .add_child(gui.Text("Game Over", FONT_PIXEL_50)) \
-        .add_child(gui.Text(f"score: {self.score}", FONT_PIXEL_35)) \
-        .add_child(gui.Text("Please enter your name", FONT_PIXEL_35)) \
-        .add_child(gui.TextInput(gui.Text("", FONT_PIXEL_35)) \
+        .add_child(gui.Text("Game Over", assets.get_font(50))) \
+        .add_child(gui.Text(f"score: {self.score}", assets.get_font(35))) \
+        .add_child(gui.Text(f"rank: {self.file_handler.get_rank(self.score)}", assets.get_font(35))) \
+        .add_child(gui.Text("Please enter your name", assets.get_font(35))) \
+        .add_child(gui.TextInput(gui.Text("", assets.get_font(35))) \
                    .set_on_action(self, 
                                   self.init_state_score, 
                                   [self.score]))
 
         self.level = False
         self.score = 0
+        self.auto_repeat.release()
+        self.router.set_focus(self.gui["gameover_enter"].get_child(4))
         self.game_state = self.game_states.gameover
 
     def init_state_score(self, score=0):
@@ -581,37 +530,48 @@ class Game:
         View score and add score if game over
         '''
         if "gameover_enter" in self.gui.keys():
-            self.file_handler.add_score_to_data(self.gui["gameover_enter"].get_child(3).get_input_text().get_content(),
+            self.file_handler.add_score_to_data(self.gui["gameover_enter"].get_child(4).get_input_text().get_content(),
                                                 score)
-            self.file_handler.write_data_to_file()
 
         self.gui.clear()
 
 
         self.gui["score_screen"] = gui.Container(LEVEL_W // 2,
                                                  LEVEL_H // 2) \
-        .add_child(gui.Text("High Scores", FONT_PIXEL_50)) \
-        .add_child(gui.Text("-------------", FONT_PIXEL_50)) \
+        .add_child(gui.Text("High Scores", assets.get_font(50))) \
+        .add_child(gui.Text("-------------", assets.get_font(50))) \
 
-        for index, score in enumerate(self.file_handler.get_score_data()):
-            if index > 10:
-                break
+        for score in self.file_handler.get_top_scores(11):
             self.gui["score_screen"] \
-            .add_child(gui.Text(f"{score[0]}: {score[1]}", FONT_PIXEL_35))
-        self.gui["score_screen"].add_child(gui.Button(gui.Text("Back to Title", FONT_PIXEL_35)).set_on_click(self, self.init_state_menu, [])) \
+            .add_child(gui.Text(f"{score[0]}: {score[1]}", assets.get_font(35)))
+        self.gui["score_screen"].add_child(gui.Button(gui.Text("Back to Title", assets.get_font(35))).set_on_click(self, self.init_state_menu, [])) \
+
+        self.router.set_focus(self.gui["score_screen"])
 
     def update_score_gui(self):
-        self.gui["score_gui"] = gui.Text("Score: " + str(self.score), FONT_PIXEL_35)
+        if "score_gui" in self.gui:
+            self.gui["score_gui"].set_content("Score: " + str(self.score))
+        else:
+            self.gui["score_gui"] = gui.Text("Score: " + str(self.score), assets.get_font(35))
 
-    def update_difficulty_gui(self):
-        self.gui["difficulty_gui"] = gui.Text("Difficulty: " + str(self.level.get_difficulty()), 
-                                              FONT_PIXEL_35, 
-                                              y = 40)
+    def update_difficulty_gui(self, difficulty=None):
+        if difficulty == None:
+            difficulty = self.level.get_difficulty()
+
+        if "difficulty_gui" in self.gui:
+            self.gui["difficulty_gui"].set_content("Difficulty: " + str(difficulty))
+        else:
+            self.gui["difficulty_gui"] = gui.Text("Difficulty: " + str(difficulty), 
+                                                  assets.get_font(35), 
+                                                  y = 40)
 
     def update_score(self, score):
         self.score += score
         self.update_score_gui()
 
+    def play_sound(self, sound):
+        self.sound_pool.play(sound, self.event_time)
+
     def get_level(self):
         return self.level
 
@@ -624,61 +584,283 @@ class Game:
         elif volume < 0:
             volume = 0
 
-        for sound in SFX.values():
-            sound.set_volume(volume)
+        assets.set_sound_volume(volume)
 
         self.sound_volume = volume
         return self
 
+    def get_fps(self):
+        return self.fps
+
+    def set_fps(self, fps):
+        self.fps = fps
+        return self
+
     def set_music_volume(self, volume):
         if volume > 1:
             volume = 1
         elif volume < 0:
             volume = 0
 
-        pygame.mixer.music.set_volume(volume)
+        if pygame.mixer.get_init():
+            pygame.mixer.music.set_volume(volume)
 
         self.music_volume = volume
         return self
 
+def getTetSprite(shape, color, ghost=False):
+    '''
+    returns (surface, (x, y)) with all cells of shape drawn in color, translucent if ghost.
+    (x, y) is the offset in pixels from the tet position to draw the surface at
+    '''
+    key = (shape.cells, color, ghost)
+    sprite = sprite_cache.get(key)
+    if sprite is None and ghost:
+        surface, offset = getTetSprite(shape, color)
+        surface = surface.copy()
+        surface.set_alpha(GHOST_ALPHA)
+        sprite = (surface, offset)
+        sprite_cache[key] = sprite
+        if len(sprite_cache) > SPRITE_CACHE_SIZE:
+            sprite_cache.popitem(last=False)
+    elif sprite is None:
+        surface = pygame.Surface(((shape.max_x - shape.min_x + 1) * GRID_SIZE,
+                                  (shape.max_y - shape.min_y + 1) * GRID_SIZE),
+                                 pygame.SRCALPHA)
+        for actual in shape.cells:
+            surface.blit(assets.get_block(color),
+                         ((actual[0] - shape.min_x) * GRID_SIZE,
+                          (actual[1] - shape.min_y) * GRID_SIZE))
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+
+        sprite = (surface, (shape.min_x * GRID_SIZE, (shape.min_y - 1) * GRID_SIZE))
+        sprite_cache[key] = sprite
+        if len(sprite_cache) > SPRITE_CACHE_SIZE:
+            sprite_cache.popitem(last=False)
+    else:
+        sprite_cache.move_to_end(key)
+    return sprite
+
 def drawTet(screen, piece):
-    for actual in (piece.getPiece())[piece.getRotIndex()]:
-        screen.blit(BLOCK_IMGS[piece.get_color()], 
-                     (piece.get_x() + actual[0] * GRID_SIZE, 
-                     (piece.get_y() + actual[1] * GRID_SIZE) - GRID_SIZE))
+    surface, offset = getTetSprite(piece.get_shape(), piece.get_color())
+    screen.blit(surface, (piece.get_x() + offset[0], piece.get_y() + offset[1]))
+
+def drawGhost(screen, level):
+    '''
+    draws the current tet of level translucent where it would land
+    '''
+    tet = level.get_tet()
+    surface, offset = getTetSprite(tet.get_shape(), tet.get_color(), True)
+    screen.blit(surface, (tet.get_x() + offset[0], level.get_drop_y() * GRID_SIZE + offset[1]))
 
 def drawLevel(screen, level):
     for row_index, row  in enumerate(level.get_map()[1:]):
         for column_index, column in enumerate(row):
             if column != 0:
-                screen.blit(BLOCK_IMGS[column], (column_index * GRID_SIZE, row_index * GRID_SIZE))
+                screen.blit(assets.get_block(column), (column_index * GRID_SIZE, row_index * GRID_SIZE))
+class LevelRenderer:
+    '''
+    keeps the background and the settled blocks of a level in a cached surface that is only
+    redrawn after a piece has been placed. each frame only the areas that changed are restored
+    from the cache and pushed to the display.
+    '''
+    def __init__(self, screen):
+        self.screen = screen
+        self.cache = pygame.Surface(screen.get_size())
+        self.level = False
+        self.cache_dirty = True
+        self.prev_rects = [] # rects of the tet and ghost drawn over the cache last frame
+        self.element_rects = {} # gui element -> rect it was drawn at last frame
+
+    def set_level(self, level):
+        if self.level != False:
+            self.level.remove_hook("locked", self.invalidate)
+        self.level = level
+        if self.level != False:
+            self.level.add_hook("locked", self.invalidate)
+        self.invalidate()
+
+    def invalidate(self):
+        self.cache_dirty = True
+
+    def rebuild_cache(self):
+        self.cache.blit(assets.get_image("BACKGROUND"), (0, 0))
+        if self.level != False:
+            drawLevel(self.cache, self.level)
+        self.cache_dirty = False
+
+    def draw(self, level, gui_elements):
+        '''
+        draws the level and the already updated gui_elements,
+        returns the list of rects that have to be passed to pygame.display.update.
+        the profiler phases draw_level (restoring the cache and the tet) and draw_gui are marked here.
+        gui elements are only pushed when they were laid out since the last frame (Element.changed),
+        unchanged ones are only redrawn if the tet or a changed element was restored over them
+        '''
+        if level is not self.level:
+            self.set_level(level)
+
+        screen_rect = self.screen.get_rect()
+        rects = []
+        if self.level != False:
+            rects.append(getGhostRect(self.level).clip(screen_rect))
+            rects.append(getTetRect(self.level.get_tet()).clip(screen_rect))
+
+        element_rects = {}
+        redraw = [] # elements that have to be drawn again this frame
+        dirty = self.prev_rects + rects
+        for element in gui_elements:
+            rect = element.get_rect().clip(screen_rect)
+            element_rects[element] = rect
+            if element.changed or self.element_rects.get(element) != rect:
+                redraw.append(element)
+                dirty.append(rect)
+        for element, rect in self.element_rects.items():
+            if element not in element_rects or element in redraw:
+                dirty.append(rect) # area the element covered last frame
+        self.element_rects = element_rects
+
+        '''
+        unchanged elements under a restored area are restored and drawn as a whole,
+        drawing them clipped to every overlapping rect would blend their edges twice
+        '''
+        found = True
+        while found:
+            found = False
+            for element in gui_elements:
+                if element not in redraw and element_rects[element].collidelist(dirty) != -1:
+                    redraw.append(element)
+                    dirty.append(element_rects[element])
+                    found = True
+
+        if self.cache_dirty:
+            self.rebuild_cache()
+            self.screen.blit(self.cache, (0, 0))
+            dirty = [self.screen.get_rect()]
+            redraw = gui_elements
+        else:
+            for rect in dirty:
+                self.screen.blit(self.cache, rect, rect)
+
+        if self.level != False:
+            drawGhost(self.screen, self.level)
+            drawTet(self.screen, self.level.get_tet())
+        profiler.mark("draw_level")
+        for element in gui_elements:
+            if element in redraw:
+                element.draw(self.screen)
+            element.changed = False
+        profiler.mark("draw_gui")
+
+        self.prev_rects = rects
+        return dirty
+
+def getTetRect(piece):
+    surface, offset = getTetSprite(piece.get_shape(), piece.get_color())
+    return surface.get_rect(topleft=(piece.get_x() + offset[0], piece.get_y() + offset[1]))
+
+def getGhostRect(level):
+    tet = level.get_tet()
+    surface, offset = getTetSprite(tet.get_shape(), tet.get_color(), True)
+    return surface.get_rect(topleft=(tet.get_x() + offset[0], level.get_drop_y() * GRID_SIZE + offset[1]))
+
+def drawLoadingScreen(screen, progress):
+    screen.fill((0, 0, 0))
+    bar = pygame.Rect(LEVEL_W // 4, LEVEL_H // 2 - 10, LEVEL_W // 2, 20)
+    pygame.draw.rect(screen, (160, 160, 160), bar, 2)
+    bar.w = int(bar.w * progress)
+    pygame.draw.rect(screen, (200, 200, 200), bar)
+
+def makeProfilerOverlay():
+    overlay = gui.Container(5, 5, center_origin=False)
+    overlay.align_mode = overlay.align_modes.left
+    for i in range(6):
+        overlay.add_child(gui.Text("", assets.get_font(20)))
+    return overlay
+
+def updateProfilerOverlay(overlay, sound_stats, layout_passes):
+    '''
+    layout_passes: most layout passes of the game's gui in one frame since the last update, 0 when idle
+    '''
+    overlay.get_child(5).set_content(f"layout passes per frame: {layout_passes}")
+    overlay.get_child(4).set_content(f"sound latency: {sound_stats['latency_ms']:.1f} ms (buffer {sound_stats['buffer_ms']:.1f} ms), dropped: {sound_stats['dropped']}")
+    stats = profiler.get_stats()
+    if stats == False:
+        return
+    overlay.get_child(0).set_content(f"fps: {stats['fps']:.0f}")
+    overlay.get_child(1).set_content(f"frame p50/p95/p99: {stats['p50']:.1f}/{stats['p95']:.1f}/{stats['p99']:.1f} ms")
+    overlay.get_child(2).set_content(f"slowest: {stats['slowest']} {stats['slowest_ms']:.2f} ms")
+    if "latency_p50" in stats:
+        overlay.get_child(3).set_content(f"input latency p50/p95: {stats['latency_p50']:.2f}/{stats['latency_p95']:.2f} ms")
+
+def get_int_setting(setting_data, setting, default):
+    value = str(setting_data.get(setting, ""))
+    if value.isnumeric():
+        return int(value)
+    return default
+
 def main():
+    file_handler = FileHandler()
+    setting_data = file_handler.get_setting_data()
+    audio.init_mixer(get_int_setting(setting_data, "audio_buffer", audio.MIXER_BUFFER))
     pygame.init()
-    screen = pygame.display.set_mode((LEVEL_W, LEVEL_H))
+    smooth = get_int_setting(setting_data, "smooth_scaling", 0) == 1
+    window = display.Display((max(1, get_int_setting(setting_data, "window_width", LEVEL_W)),
+                              max(1, get_int_setting(setting_data, "window_height", LEVEL_H))),
+                             smooth, integer_scale=not smooth)
+    screen = window.get_surface() # everything is drawn at LEVEL_W x LEVEL_H, see display.py
     clock = pygame.time.Clock()
     running = True
 
-    gui = {}
+    '''
+    load assets in the background while showing a loading bar
+    '''
+    loader = assets.preload_in_background()
+    while loader.is_alive():
+        pygame.event.pump()
+        drawLoadingScreen(screen, assets.get_progress())
+        window.present()
+        clock.tick(30)
+    assets.convert_loaded()
 
-    game = Game(gui)
+    gui_elements = {}
 
-    def draw_before_gui():
-        screen.blit(IMG_BACKGROUND, (0, 0))
-        if not game.get_level() == False:
-            drawTet(screen, game.get_level().get_tet())
-            drawLevel(screen, game.get_level())
+    game = Game(gui_elements, file_handler)
+    renderer = LevelRenderer(screen)
+
+    overlay = makeProfilerOverlay()
+    frame = 0
+    max_layout_passes = 0 # most layout passes in a frame since the overlay was last updated
 
     while running:
-        clock.tick(60)
+        profiler.start_frame()
+        dt = clock.tick(game.get_fps()) / 1000
+        profiler.mark("wait")
 
-        running = not game.loop()
+        running = not game.loop(dt)
+        if game.window_size != False:
+            window.resize(game.window_size)
+            game.window_size = False
 
-        draw_before_gui()
-        for element in gui.values():
+        elements = list(gui_elements.values())
+        for element in elements:
             element.update()
-            element.draw(screen)
-        pygame.display.flip()
-
+        max_layout_passes = max(max_layout_passes, gui.reset_layout_passes())
+        if profiler.enabled:
+            if frame % OVERLAY_REFRESH == 0:
+                updateProfilerOverlay(overlay, game.sound_pool.get_stats(), max_layout_passes)
+                max_layout_passes = 0
+            overlay.update()
+            gui.reset_layout_passes() # the overlay lays itself out whenever its text changes, not counted
+            elements.append(overlay)
+        profiler.mark("gui")
+        dirty = renderer.draw(game.get_level(), elements) # marks the draw_level and draw_gui phases
+        window.present(dirty)
+        profiler.mark("flip")
+        frame += 1
+
+    game.save_game()
     pygame.quit()
 
 if __name__ == "__main__":
@@ -2,6 +2,38 @@ from enum import Enum
 import pygame
 import copy
 import string
+from collections import OrderedDict
+
+TEXT_CACHE_SIZE = 256 # max amount of rendered text surfaces kept around
+text_cache = OrderedDict() # (content, font, color, antialias) -> rendered surface, least recently used first
+
+def render_text(content, font, color, antialias=True):
+    '''
+    returns font.render(content, antialias, color), rendered surfaces are shared
+    between all callers and the least recently used ones are dropped after TEXT_CACHE_SIZE
+    '''
+    key = (content, font, tuple(color), antialias)
+    surface = text_cache.get(key)
+    if surface is None:
+        surface = font.render(content, antialias, color)
+        text_cache[key] = surface
+        if len(text_cache) > TEXT_CACHE_SIZE:
+            text_cache.popitem(last=False)
+    else:
+        text_cache.move_to_end(key)
+    return surface
+
+MAX_LAYOUT_PASSES = 4 # layout passes per update until positions have to settle, the rest is done next update
+layout_passes = 0 # layout passes done since the last reset_layout_passes call
+
+def reset_layout_passes():
+    '''
+    returns the amount of layout passes done since the last call and starts counting from 0 again
+    '''
+    global layout_passes
+    passes = layout_passes
+    layout_passes = 0
+    return passes
 
 class Element:
     x = 0
@@ -16,7 +48,8 @@ class Element:
     selectable = False
     center_origin = False
     debug = False
-    first_update = True
+    dirty = True # layout has to be redone on the next update
+    changed = True # laid out since the renderer last drew it, reset by LevelRenderer.draw
 
     def __init__(self, x=0, y=0, center_origin=False):
         self.x = x
@@ -47,10 +80,12 @@ class Element:
 
     def set_x(self, x):
         self.x = x
+        self.invalidate()
         return self
 
     def set_y(self, y):
         self.y = y
+        self.invalidate()
         return self
 
     def get_h(self):
@@ -59,17 +94,45 @@ class Element:
     def get_w(self):
         return self.w
 
+    def get_rect(self):
+        return pygame.Rect(self.actual_x, self.actual_y, self.w, self.h)
+
     def set_color(self, color):
         self.color = color
+        self.invalidate()
         return self
 
     def get_selectable(self):
         return self.selectable
 
+    def invalidate(self):
+        '''
+        marks the layout and cached surfaces of this element and all of its parents as out of date
+        '''
+        self.dirty = True
+        if self.parent != False:
+            self.parent.invalidate()
+
     def update(self):
-        if self.first_update:
-            self.first_update = False
-            self.update()
+        '''
+        lays out the element if anything changed since the last update.
+        repeats the layout until size and position stop changing, since they depend on each other
+        '''
+        passes = 0
+        while self.dirty and passes < MAX_LAYOUT_PASSES:
+            before = (self.actual_x, self.actual_y, self.w, self.h)
+            self.layout()
+            passes += 1
+            self.dirty = before != (self.actual_x, self.actual_y, self.w, self.h)
+
+    def layout(self):
+        '''
+        calculates actual position and size, parents call this on their children during their own layout
+        '''
+        global layout_passes
+        layout_passes += 1
+        self.dirty = False
+        self.changed = True
 
         self.actual_x = self.x
         self.actual_y = self.y
@@ -90,6 +153,7 @@ class Element:
 
     def set_parent(self, element):
         self.parent = element
+        self.invalidate()
 
     def get_centered(self):
         return self.center_origin
@@ -97,24 +161,36 @@ class Element:
 class Text(Element):
     content = False
     font = False
+    antialias = True
 
     def __init__(self, content, font, x=0, y=0, center_origin=False):
         super().__init__(x, y, center_origin)
         self.content = content
         self.font = font
+        self.surface = False
+        self.surface_key = False # (content, font, color, antialias) surface was rendered with
 
-    def draw(self, screen, x_off=0, y_off=0):
-        text = self.font.render(self.content, True, self.color)
+    def get_surface(self):
+        '''
+        returns the rendered text, only renders again if content, font or color changed
+        '''
+        key = (self.content, self.font, self.color, self.antialias)
+        if key != self.surface_key:
+            self.surface = render_text(self.content, self.font, self.color, self.antialias)
+            self.surface_key = key
+        return self.surface
 
-        screen.blit(text, (self.actual_x + x_off, self.actual_y + y_off))
+    def draw(self, screen, x_off=0, y_off=0):
+        screen.blit(self.get_surface(), (self.actual_x + x_off, self.actual_y + y_off))
     
-    def update(self):
-        super().update()
-        self.w = int(self.font.render(self.content, True, (0,0,0)).get_width())
-        self.h = int(self.font.render(self.content, True, (0,0,0)).get_height())
+    def layout(self):
+        super().layout()
+        self.w, self.h = self.get_surface().get_size()
 
     def set_content(self, content):
-        self.content = content
+        if content != self.content:
+            self.content = content
+            self.invalidate()
         return self
 
     def get_content(self):
@@ -122,6 +198,7 @@ class Text(Element):
 
     def set_font(self, font):
         self.font = font
+        self.invalidate()
         return self
 
     def get_font(self):
@@ -162,23 +239,24 @@ class BoxElement(Element):
                                  self.border_w,
                                  self.corner_roundness)
 
-    def update(self):
-        super().update()
-
     def set_border_w(self, w):
         self.border_w = w
+        self.invalidate()
         return self
 
     def set_border_color(self, color):
         self.border_color = color
+        self.invalidate()
         return self
 
     def set_corner_roundness(self, roundness):
         self.corner_roundness = roundness
+        self.invalidate()
         return self
 
     def set_padding(self, padding):
         self.padding = padding
+        self.invalidate()
         return self
 
 
@@ -190,6 +268,9 @@ class Container(BoxElement):
         super().__init__(x,y,center_origin)
         self.children = []
         self.align_mode = self.align_modes.center
+        self.cached_surface = False # container and children drawn at their current layout
+        self.selectable_children = False # cached result of find_selectable, False = not known
+        self.last_selected = False # (index, child) get_selected found last time
         self.default_style()
 
     def default_style(self):
@@ -202,23 +283,34 @@ class Container(BoxElement):
 
     def set_child_spacing(self, spacing):
         self.child_spacing = spacing
+        self.invalidate()
         return self
 
+    def invalidate(self):
+        self.cached_surface = False
+        super().invalidate()
+
     def get_child(self, index):
         return self.children[index]
 
+    def get_rect(self):
+        return super().get_rect().unionall([child.get_rect() for child in self.children])
+
     def add_child(self, element):
         self.children.append(element)
+        self.selectable_children = False
         element.set_parent(self)
         return self
 
     def add_child_at(self, element, pos):
         if pos < 0:
             raise Exception("add_child_at called with negative pos argument")
-        elif pos >= len(children):
+        elif pos >= len(self.children):
             self.children.append(element)
         else:
             self.children.insert(pos, element)
+        self.selectable_children = False
+        self.last_selected = False
         element.set_parent(self)
         return self
 
@@ -231,27 +323,47 @@ class Container(BoxElement):
             if event.key == key_gui_action:
                 if self.get_selected() != False:
                     self.get_selected()[1].on_click()
+                return
 
-        for child in self.children:
-            child.input(event)
+        '''
+        only the selected child gets the event, not every child
+        '''
+        selected = self.get_selected()
+        if selected != False:
+            selected[1].input(event, key_gui_up, key_gui_down, key_gui_action)
 
     def draw(self, screen, x_off=0, y_off=0):
+        '''
+        draws the container and its children into cached_surface once, after that
+        it is just blitted until something changes
+        '''
+        rect = self.get_rect()
+        if self.cached_surface == False:
+            self.cached_surface = pygame.Surface(rect.size, pygame.SRCALPHA)
+            self.draw_uncached(self.cached_surface, -rect.x, -rect.y)
+            if pygame.display.get_surface() is not None:
+                self.cached_surface = self.cached_surface.convert_alpha()
+
+        screen.blit(self.cached_surface, (rect.x + x_off, rect.y + y_off))
+
+    def draw_uncached(self, screen, x_off=0, y_off=0):
         super().draw(screen, x_off, y_off)
 
         for child in self.children:
             child.draw(screen, x_off, y_off)
 
-    def update(self):
-        super().update()
+    def layout(self):
+        super().layout()
+        self.cached_surface = False
 
         self.h = 0
         self.w = 0
 
         '''
-        update all children
+        lay out all children
         '''
         for child in self.children:
-            child.update()
+            child.layout()
 
         '''
         set width to highest child width
@@ -302,10 +414,9 @@ class Container(BoxElement):
                     selectable[0].set_selected(True)
 
     def find_selectable(self):
-        selectable = []
-        for child in self.children:
-            if child.get_selectable():
-                selectable.append(child)
+        if self.selectable_children == False:
+            self.selectable_children = [child for child in self.children if child.get_selectable()]
+        selectable = self.selectable_children
         if len(selectable) == 0:
             return False
         else:
@@ -316,9 +427,12 @@ class Container(BoxElement):
             selectable = self.find_selectable()
         if selectable == False:
             return False
+        if self.last_selected != False and self.last_selected[1].get_selected():
+            return self.last_selected
         for s_index, s in enumerate(selectable):
             if s.get_selected():
-                return (s_index, s)
+                self.last_selected = (s_index, s)
+                return self.last_selected
         return False
 
 
@@ -347,7 +461,9 @@ class Button(BoxElement):
         .set_padding((5,10,5,10))
 
     def set_selected(self, selected):
-        self.selected = selected
+        if selected != self.selected:
+            self.selected = selected
+            self.invalidate()
         return self
 
     def get_selected(self):
@@ -355,18 +471,23 @@ class Button(BoxElement):
 
     def set_color_deselected(self, color):
         self.color_deselected = color
+        self.invalidate()
         return self
 
     def set_color_selected(self,color):
         self.color_selected = color
+        self.invalidate()
         return self
 
-    def draw(self, screen, x_off, y_off):
+    def get_rect(self):
+        return super().get_rect().union(self.child_label.get_rect())
+
+    def draw(self, screen, x_off=0, y_off=0):
         super().draw(screen, x_off, y_off)
 
-        self.child_label.draw(screen)
+        self.child_label.draw(screen, x_off, y_off)
 
-    def update(self):
+    def layout(self):
         self.h = self.child_label.get_h() + self.padding[0] + self.padding[2]
         self.w = self.child_label.get_w() + self.padding[1] + self.padding[3]
 
@@ -375,11 +496,11 @@ class Button(BoxElement):
         else:
             self.color = self.color_deselected
 
-        self.child_label.update()
+        self.child_label.layout()
         self.child_label.set_actual_x(self.child_label.get_actual_x() + self.padding[3])
         self.child_label.set_actual_y(self.child_label.get_actual_y() + self.padding[0])
 
-        super().update()
+        super().layout()
 
 
 
@@ -414,8 +535,8 @@ class TextInput(BoxElement):
         .set_border_color((0,0,0)) \
         .set_color((180,180,255))
 
-    def update(self):
-        self.input_text.update()
+    def layout(self):
+        self.input_text.layout()
         self.input_text.set_actual_x(self.input_text.get_actual_x() + self.padding[3])
         self.input_text.set_actual_y(self.input_text.get_actual_y() + self.padding[0])
 
@@ -425,11 +546,14 @@ class TextInput(BoxElement):
         self.w += self.padding[1] + self.padding[3]
         self.h += self.padding[0] + self.padding[2]
         
-        super().update()
+        super().layout()
     
     def draw(self, screen, x_off=0, y_off=0):
         super().draw(screen, x_off, y_off)
-        self.input_text.draw(screen)
+        self.input_text.draw(screen, x_off, y_off)
+
+    def get_rect(self):
+        return super().get_rect().union(self.input_text.get_rect())
 
     def get_input_text(self):
         cp = copy.copy(self.input_text)
@@ -0,0 +1,111 @@
+'''
+per-frame phase timings. main calls start_frame() once per frame and mark(name) after each phase,
+the time since the previous mark is recorded as that phase. while disabled mark and start_frame
+return right away, so the calls can stay in the game loop.
+recorded frames can be exported in the chrome trace format (chrome://tracing, ui.perfetto.dev).
+'''
+
+import json
+import time
+from collections import deque
+
+HISTORY = 600 # frames kept for the stats and the trace
+IDLE_PHASES = ("wait",) # phases that only wait for the next frame, never reported as the slowest phase
+
+enabled = False
+frames = deque(maxlen=HISTORY) # (frame start, [(phase, start, duration)]), times in seconds
+latencies = deque(maxlen=HISTORY) # seconds from an input event to its action being applied
+current = False # phases of the frame being recorded
+last_mark = 0
+
+def set_enabled(enable):
+    global enabled, current
+    enabled = enable
+    current = False
+    if not enable:
+        frames.clear()
+        latencies.clear()
+
+def toggle():
+    set_enabled(not enabled)
+    return enabled
+
+def start_frame():
+    global current, last_mark
+    if not enabled:
+        return
+    last_mark = time.perf_counter()
+    current = []
+    frames.append((last_mark, current))
+
+def mark(name):
+    '''
+    records the time since the last mark (or start_frame) as phase name of the current frame
+    '''
+    global last_mark
+    if not enabled or current == False:
+        return
+    now = time.perf_counter()
+    current.append((name, last_mark, now - last_mark))
+    last_mark = now
+
+def add_latency(seconds):
+    if enabled:
+        latencies.append(seconds)
+
+def percentile(values, fraction):
+    '''
+    values has to be sorted
+    '''
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def get_stats():
+    '''
+    returns a dict with fps, frame time and input latency percentiles in ms and the phase with the highest average time,
+    False if there are not enough frames yet. the frame being recorded is left out
+    '''
+    done = list(frames)[:-1]
+    if len(done) < 2:
+        return False
+
+    frame_times = sorted(sum(phase[2] for phase in phases) for start, phases in done)
+    phase_totals = {}
+    for start, phases in done:
+        for name, phase_start, duration in phases:
+            if name in IDLE_PHASES:
+                continue
+            phase_totals[name] = phase_totals.get(name, 0) + duration
+    slowest = max(phase_totals, key=phase_totals.get, default=False)
+
+    span = frames[-1][0] - done[0][0]
+    stats = {"fps": len(done) / span if span > 0 else 0,
+             "p50": percentile(frame_times, 0.5) * 1000,
+             "p95": percentile(frame_times, 0.95) * 1000,
+             "p99": percentile(frame_times, 0.99) * 1000,
+             "slowest": slowest,
+             "slowest_ms": phase_totals.get(slowest, 0) / len(done) * 1000}
+    if latencies:
+        latency = sorted(latencies)
+        stats["latency_p50"] = percentile(latency, 0.5) * 1000
+        stats["latency_p95"] = percentile(latency, 0.95) * 1000
+    return stats
+
+def export_trace(path):
+    '''
+    writes the recorded frames as a chrome trace json file, every frame and phase is a complete ("X") event
+    '''
+    events = []
+    for index, (start, phases) in enumerate(list(frames)):
+        if not phases:
+            continue
+        duration = phases[-1][1] + phases[-1][2] - start
+        events.append({"name": "frame", "cat": "frame", "ph": "X", "pid": 1, "tid": 1,
+                       "ts": start * 1e6, "dur": duration * 1e6, "args": {"index": index}})
+        for name, phase_start, phase_duration in phases:
+            events.append({"name": name, "cat": "phase", "ph": "X", "pid": 1, "tid": 1,
+                           "ts": phase_start * 1e6, "dur": phase_duration * 1e6})
+
+    file = open(path, "w")
+    json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+    file.close()
+    return len(events)
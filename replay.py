@@ -0,0 +1,144 @@
+'''
+compact binary replays of a level: the seed and every gameplay input stamped with the level frame
+it was applied on. replays are played back headless, as fast as the engine can update.
+
+format (all numbers are unsigned LEB128 varints):
+    MAGIC, VERSION byte, seed
+    events: (frames since previous event << 3 | action)
+    ACTION_END event followed by the final score
+'''
+
+from engine import BitLevel
+
+MAGIC = b"TRPL"
+VERSION = 2 # version 2 added ACTION_HARD_DROP, version 1 replays can still be played
+
+ACTION_ROTATE = 0
+ACTION_MOVE_L = 1
+ACTION_MOVE_R = 2
+ACTION_DROP_ON = 3
+ACTION_DROP_OFF = 4
+ACTION_END = 5
+ACTION_HARD_DROP = 6
+
+def apply_action(level, action):
+    '''
+    does what a gameplay input does to the current tet of level
+    '''
+    tet = level.get_tet()
+    if action == ACTION_ROTATE:
+        tet.try_rotate()
+    elif action == ACTION_MOVE_L:
+        tet.move_l()
+    elif action == ACTION_MOVE_R:
+        tet.move_r()
+    elif action == ACTION_DROP_ON:
+        tet.set_dropping(True)
+    elif action == ACTION_DROP_OFF:
+        tet.set_dropping(False)
+    elif action == ACTION_HARD_DROP:
+        tet.hard_drop()
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, pos):
+    '''
+    returns (value, position after the value)
+    '''
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+class Recorder:
+    '''
+    records the inputs applied to a level, call record() right after applying an input
+    and finish() once the level is over
+    '''
+    def __init__(self, level):
+        self.level = level
+        self.data = bytearray(MAGIC)
+        self.data.append(VERSION)
+        write_varint(self.data, level.get_seed())
+        self.last_frame = 0
+        self.finished = False
+
+    def record(self, action):
+        if self.finished:
+            return self
+        frame = self.level.get_frame()
+        write_varint(self.data, (frame - self.last_frame) << 3 | action)
+        self.last_frame = frame
+        return self
+
+    def finish(self):
+        if not self.finished:
+            self.record(ACTION_END)
+            write_varint(self.data, self.level.get_score())
+            self.finished = True
+        return self
+
+    def get_bytes(self):
+        return bytes(self.data)
+
+    def save(self, path):
+        file = open(path, "wb")
+        file.write(self.data)
+        file.close()
+        return self
+
+class Replay:
+    def __init__(self, data):
+        '''
+        parses replay data as written by Recorder
+        '''
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a replay")
+        if data[len(MAGIC)] < 1 or data[len(MAGIC)] > VERSION:
+            raise ValueError(f"unsupported replay version {data[len(MAGIC)]}")
+
+        pos = len(MAGIC) + 1
+        self.seed, pos = read_varint(data, pos)
+        self.events = [] # (frame, action)
+        self.score = None # final score, None if the recording was not finished
+        frame = 0
+        while pos < len(data):
+            value, pos = read_varint(data, pos)
+            frame += value >> 3
+            action = value & 7
+            if action == ACTION_END:
+                self.score, pos = read_varint(data, pos)
+                self.end_frame = frame
+                break
+            self.events.append((frame, action))
+
+    def play(self, level_class=BitLevel):
+        '''
+        simulates the whole replay headless and returns the level in its final state
+        '''
+        level = level_class(self.seed)
+        for frame, action in self.events:
+            while level.get_frame() < frame:
+                level.update()
+            apply_action(level, action)
+
+        if self.score is not None:
+            while level.get_frame() < self.end_frame:
+                level.update()
+
+        return level
+
+def load_replay(path):
+    file = open(path, "rb")
+    data = file.read()
+    file.close()
+    return Replay(data)
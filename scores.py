@@ -0,0 +1,133 @@
+'''
+ranked index of high scores.
+
+scores are kept sorted from highest to lowest (equal scores: newest first) in blocks of at most
+2 * BLOCK_SIZE entries. a fenwick tree over the block lengths gives the position of a block in
+O(log n), so inserting, ranking and reading the top scores never walk the whole list.
+'''
+
+from bisect import bisect_left, insort
+
+BLOCK_SIZE = 512
+
+class ScoreIndex:
+    def __init__(self, scores=()):
+        '''
+        scores is an iterable of (name, score) sorted from highest to lowest, like data.txt
+        '''
+        self.blocks = [] # lists of (-score, -sequence, name)
+        self.block_max = [] # last (lowest) key of each block, used to find the block of a key
+        self.tree = [] # fenwick tree over len(block)
+        self.best = {} # name -> best score of that name
+        self.size = 0
+        self.sequence = 0 # increases with every add, newer equal scores rank first
+
+        '''
+        the first entry of scores is the newest of its score. loaded entries get sequence numbers
+        0, -1, -2... so they rank after equal scores added later
+        '''
+        entries = []
+        for index, element in enumerate(scores):
+            entries.append((-element[1], index, element[0]))
+            self.update_best(element[0], element[1])
+        entries.sort()
+        for start in range(0, len(entries), BLOCK_SIZE):
+            self.blocks.append(entries[start:start + BLOCK_SIZE])
+        self.size = len(entries)
+        self.rebuild()
+
+    def __len__(self):
+        return self.size
+
+    def update_best(self, name, score):
+        if name not in self.best or self.best[name] < score:
+            self.best[name] = score
+
+    def rebuild(self):
+        '''
+        recalculates block_max and the fenwick tree after blocks have been split
+        '''
+        self.block_max = [block[-1] for block in self.blocks]
+        self.tree = [0] * (len(self.blocks) + 1)
+        for index, block in enumerate(self.blocks):
+            self.tree_add(index, len(block))
+
+    def tree_add(self, block_index, amount):
+        i = block_index + 1
+        while i < len(self.tree):
+            self.tree[i] += amount
+            i += i & -i
+
+    def tree_prefix(self, block_index):
+        '''
+        amount of entries in the blocks before block_index
+        '''
+        total = 0
+        i = block_index
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def add(self, name, score):
+        '''
+        inserts a score, returns its rank (1 = highest)
+        '''
+        self.sequence += 1
+        key = (-score, -self.sequence, name)
+        self.update_best(name, score)
+        self.size += 1
+
+        if not self.blocks:
+            self.blocks.append([key])
+            self.rebuild()
+            return 1
+
+        block_index = bisect_left(self.block_max, key)
+        if block_index == len(self.blocks):
+            block_index -= 1
+        block = self.blocks[block_index]
+        insort(block, key)
+        position = self.tree_prefix(block_index) + bisect_left(block, key)
+
+        if len(block) > 2 * BLOCK_SIZE:
+            self.blocks[block_index:block_index + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self.rebuild()
+        else:
+            self.block_max[block_index] = block[-1]
+            self.tree_add(block_index, 1)
+
+        return position + 1
+
+    def rank(self, score):
+        '''
+        rank a new score would get, 1 + the amount of stored scores that are higher
+        '''
+        key = (-score,)
+        block_index = bisect_left(self.block_max, key)
+        if block_index == len(self.blocks):
+            return self.size + 1
+        return self.tree_prefix(block_index) + bisect_left(self.blocks[block_index], key) + 1
+
+    def top(self, k):
+        '''
+        returns the k highest scores as a list of (name, score)
+        '''
+        result = []
+        for block in self.blocks:
+            for key in block:
+                if len(result) >= k:
+                    return result
+                result.append((key[2], -key[0]))
+        return result
+
+    def get_best(self, name):
+        '''
+        best score of name, False if name has no score
+        '''
+        return self.best.get(name, False)
+
+    def __iter__(self):
+        for block in self.blocks:
+            for key in block:
+                yield (key[2], -key[0])
@@ -0,0 +1,135 @@
+'''
+placement search for bots. finds every final position the current tet can reach on a board
+with the moves the game allows: move left/right, rotate in place (no kicks, see Tet.try_rotate)
+and fall one row, any amount of moves per row.
+
+boards are 21 row bitmasks like BitLevel.rows (bit x set = column x occupied).
+'''
+
+from engine import FULL_ROW, Level
+
+_shifted = {} # Shape -> row masks of the shape per grid column, see get_shifted
+
+def get_shifted(shape):
+    '''
+    returns a list indexed by grid column x - shape.col_min of ((dy, row mask), ...) of shape at column x
+    '''
+    table = _shifted.get(shape)
+    if table is None:
+        table = [tuple((dy, mask << (x + shape.min_x)) for dy, mask in shape.masks)
+                 for x in range(shape.col_min, shape.col_max + 1)]
+        _shifted[shape] = table
+    return table
+
+class Placement:
+    '''
+    a final position of a tet and the board after locking it there
+    '''
+    def __init__(self, x, y, rot, rows, lines, score, parents):
+        self.x = x # grid position and rotation index the tet locks at
+        self.y = y
+        self.rot = rot
+        self.rows = rows # tuple of 21 row bitmasks after locking and clearing lines
+        self.lines = lines
+        self.score = score
+        self.game_over = rows[1] != 0
+        self.parents = parents # (x, y, rot) -> (previous state, move), shared by all placements of a search
+
+    def get_path(self):
+        '''
+        returns the moves ("left", "right", "rotate", "down") from the start position to this placement
+        '''
+        path = []
+        state = (self.x, self.y, self.rot)
+        while self.parents[state] is not None:
+            state, move = self.parents[state]
+            path.append(move)
+        path.reverse()
+        return path
+
+def find_placements(rows, shapes, x=5, y=1, rot=0, rewards=Level.score_base):
+    '''
+    returns a Placement for every distinct board the tet with the given shapes (Tet.shapes) can end up
+    in when starting at grid position x, y with rotation index rot. placements that cover the same
+    cells are only returned once. returns [] if the start position is blocked
+    '''
+    tables = [get_shifted(shape) for shape in shapes]
+    rot_count = len(shapes)
+
+    def fits(x, y, rot):
+        shape = shapes[rot]
+        if x < shape.col_min or x > shape.col_max or y > shape.row_max:
+            return False
+        for dy, mask in tables[rot][x - shape.col_min]:
+            if rows[y + dy] & mask:
+                return False
+        return True
+
+    if not fits(x, y, rot):
+        return []
+
+    start = (x, y, rot)
+    parents = {start: None}
+    queue = [start]
+    locked = set() # cells of the placements found so far
+    placements = []
+
+    for state in queue:
+        x, y, rot = state
+        for next_state, move in (((x - 1, y, rot), "left"),
+                                 ((x + 1, y, rot), "right"),
+                                 ((x, y, (rot + 1) % rot_count), "rotate")):
+            if next_state not in parents and fits(*next_state):
+                parents[next_state] = (state, move)
+                queue.append(next_state)
+
+        below = (x, y + 1, rot)
+        if below in parents:
+            continue
+        if fits(*below):
+            parents[below] = (state, "down")
+            queue.append(below)
+            continue
+
+        '''
+        can't fall any further, lock the tet here
+        '''
+        cells = tables[rot][x - shapes[rot].col_min]
+        key = tuple((y + dy, mask) for dy, mask in cells)
+        if key in locked:
+            continue
+        locked.add(key)
+
+        board = list(rows)
+        for dy, mask in cells:
+            board[y + dy] |= mask
+        lines = 0
+        for row_index in range(len(board)):
+            if board[row_index] == FULL_ROW:
+                del board[row_index]
+                board.insert(1, 0) # same as Level.push_lines
+                lines += 1
+
+        placements.append(Placement(x, y, rot, tuple(board), lines, rewards[lines], parents))
+
+    return placements
+
+def level_placements(level):
+    '''
+    find_placements for the current tet of level, scored with the rewards of the current difficulty
+    '''
+    tet = level.get_tet()
+    return find_placements(level.get_rows(), tet.shapes, tet.grid_x, tet.grid_y, tet.rot_index,
+                           level.get_score_rewards())
+
+def apply_placement(level, placement):
+    '''
+    moves the current tet of level straight to placement and locks it, like it had fallen there.
+    all hooks of the level are called as usual
+    '''
+    tet = level.get_tet()
+    tet.grid_x = placement.x
+    tet.grid_y = placement.y
+    tet.rot_index = placement.rot
+    level.assimilate()
+    return level
@@ -0,0 +1,243 @@
+#!/usr/bin/python3
+
+'''
+plays many headless games with a bot policy on all cores, run with ./selfplay.py --help
+every finished game is appended to a json lines file as soon as it arrives, the aggregated
+statistics are printed and written to a summary file at the end.
+
+a policy is a function (level, placements, rng) -> one of placements (see search.py),
+either one of POLICIES or "module:function".
+'''
+
+import json
+import time
+import queue
+import random
+import argparse
+import importlib
+import threading
+import multiprocessing
+import search
+from engine import BitLevel, Level
+
+METRICS = ("score", "lines", "pieces", "difficulty") # aggregated per game
+
+def random_policy(level, placements, rng):
+    return rng.choice(placements)
+
+def evaluate(placement):
+    '''
+    board heuristic, higher is better: rewards cleared lines, punishes height, holes and bumpiness
+    '''
+    if placement.game_over:
+        return float("-inf")
+
+    heights = [0] * 10
+    holes = 0
+    covered = 0 # columns with a block somewhere above the current row
+    for row_index, row in enumerate(placement.rows):
+        holes += bin(covered & ~row).count("1")
+        new = row & ~covered
+        while new:
+            bit = new & -new
+            heights[bit.bit_length() - 1] = 21 - row_index
+            new ^= bit
+        covered |= row
+
+    bumpiness = 0
+    for x in range(9):
+        bumpiness += abs(heights[x] - heights[x + 1])
+
+    return placement.lines * 0.76 - sum(heights) * 0.51 - holes * 0.36 - bumpiness * 0.18
+
+def greedy_policy(level, placements, rng):
+    return max(placements, key=evaluate)
+
+POLICIES = {"random": random_policy,
+            "greedy": greedy_policy}
+
+def get_policy(name):
+    if name in POLICIES:
+        return POLICIES[name]
+    module, function = name.split(":", 1)
+    return getattr(importlib.import_module(module), function)
+
+def play_game(seed, policy, config):
+    '''
+    plays one game with policy until game over or config["max_pieces"] pieces, returns its stats
+    '''
+    level = BitLevel(seed)
+    level.difficulty_increase_on_stage = config["difficulty_increase_on_stage"]
+    level.max_difficulty = config["max_difficulty"]
+    level.score_base = config["score_base"]
+    level.set_difficulty(level.get_difficulty())
+    rng = random.Random(seed)
+
+    lines = 0
+    def on_lines(cleared):
+        nonlocal lines
+        lines += cleared
+    level.add_hook("lines", on_lines)
+
+    pieces = 0
+    game_over = False
+    while pieces < config["max_pieces"]:
+        level.update_difficulty()
+        placements = search.level_placements(level)
+        if not placements:
+            game_over = True
+            break
+        search.apply_placement(level, policy(level, placements, rng))
+        pieces += 1
+        if level.check_game_over():
+            game_over = True
+            break
+
+    return {"seed": seed,
+            "score": level.get_score(),
+            "lines": lines,
+            "pieces": pieces,
+            "difficulty": level.get_difficulty(),
+            "game_over": game_over}
+
+def play_games(task):
+    '''
+    runs in a worker process, task is (first seed, amount of games, policy name, config)
+    '''
+    first_seed, count, policy_name, config = task
+    policy = get_policy(policy_name)
+    return [play_game(first_seed + i, policy, config) for i in range(count)]
+
+class Stats:
+    '''
+    running count, mean, standard deviation, min and max of each of METRICS, memory does not grow with the games
+    '''
+    def __init__(self):
+        self.count = 0
+        self.game_overs = 0
+        self.sums = {metric: 0 for metric in METRICS}
+        self.squares = {metric: 0 for metric in METRICS}
+        self.mins = {}
+        self.maxs = {}
+
+    def add(self, result):
+        self.count += 1
+        self.game_overs += result["game_over"]
+        for metric in METRICS:
+            value = result[metric]
+            self.sums[metric] += value
+            self.squares[metric] += value * value
+            self.mins[metric] = min(self.mins.get(metric, value), value)
+            self.maxs[metric] = max(self.maxs.get(metric, value), value)
+        return self
+
+    def get_summary(self):
+        summary = {"games": self.count, "game_overs": self.game_overs}
+        for metric in METRICS:
+            if self.count == 0:
+                break
+            mean = self.sums[metric] / self.count
+            variance = max(0, self.squares[metric] / self.count - mean * mean)
+            summary[metric] = {"mean": mean,
+                               "std": variance ** 0.5,
+                               "min": self.mins[metric],
+                               "max": self.maxs[metric]}
+        return summary
+
+def run(games, policy_name, config, output, workers=None, seed=0, chunk=4):
+    '''
+    plays games games on workers processes (all cores if None) and appends one json line per game to output.
+    games are seeded seed * 2**32 + index, so a run gives the same games no matter how many workers play it.
+    tasks are made as they are needed and a fixed amount is kept in flight, a new one is submitted
+    as soon as any finishes. returns the Stats of all games
+    '''
+    get_policy(policy_name) # fail here instead of in every worker
+    workers = workers or multiprocessing.cpu_count()
+    first_seed = seed << 32
+    window = threading.Semaphore(workers * 4) # tasks in flight
+    results = queue.Queue() # finished tasks, written by the main thread
+    errors = []
+
+    def on_done(task_results):
+        results.put(task_results)
+        window.release()
+
+    def on_error(error):
+        errors.append(error)
+        results.put([])
+        window.release()
+
+    stats = Stats()
+    file = open(output, "a")
+    pool = multiprocessing.Pool(workers)
+    submitted = 0
+    finished = 0
+    try:
+        for start in range(0, games, chunk):
+            window.acquire()
+            if errors:
+                break
+            task = (first_seed + start, min(chunk, games - start), policy_name, config)
+            pool.apply_async(play_games, (task,), callback=on_done, error_callback=on_error)
+            submitted += 1
+            finished += write_results(results, file, stats)
+        while finished < submitted:
+            finished += write_results(results, file, stats, block=True)
+    finally:
+        pool.terminate()
+        file.close()
+    if errors:
+        raise errors[0]
+    return stats
+
+def write_results(results, file, stats, block=False):
+    '''
+    writes the finished tasks in results, waits for one first if block is set. returns the amount of tasks written
+    '''
+    written = 0
+    while block or not results.empty():
+        block = False
+        for result in results.get():
+            file.write(json.dumps(result) + "\n")
+            stats.add(result)
+        file.flush()
+        written += 1
+    return written
+
+def main():
+    defaults = Level(0)
+    parser = argparse.ArgumentParser(description="plays headless games with a bot policy on all cores")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--policy", default="greedy", help="one of " + ", ".join(POLICIES) + " or module:function")
+    parser.add_argument("--workers", type=int, default=None, help="processes, default: all cores")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-pieces", type=int, default=10000, help="games are stopped after this many pieces")
+    parser.add_argument("--difficulty-increase-on-stage", type=int, default=defaults.difficulty_increase_on_stage)
+    parser.add_argument("--max-difficulty", type=int, default=defaults.max_difficulty)
+    parser.add_argument("--score-base", default=",".join(map(str, defaults.score_base)),
+                        help="rewards at difficulty 1 for 0, 1, 2, 3 and 4 lines")
+    parser.add_argument("--output", default="selfplay.jsonl", help="every game is appended here as a json line")
+    args = parser.parse_args()
+
+    config = {"difficulty_increase_on_stage": args.difficulty_increase_on_stage,
+              "max_difficulty": args.max_difficulty,
+              "score_base": tuple(int(reward) for reward in args.score_base.split(",")),
+              "max_pieces": args.max_pieces}
+
+    start = time.perf_counter()
+    stats = run(args.games, args.policy, config, args.output, args.workers, args.seed)
+    seconds = time.perf_counter() - start
+
+    summary = stats.get_summary()
+    summary["config"] = config
+    summary["policy"] = args.policy
+    summary["seconds"] = seconds
+    file = open(args.output + ".summary.json", "w")
+    json.dump(summary, file, indent=1)
+    file.close()
+
+    print(json.dumps(summary, indent=1))
+    print(f"{stats.count / seconds:.1f} games/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/python3
+
+'''
+asyncio match server. every connection can play one match at a time on a headless BitLevel,
+all matches are updated by one shared scheduler at TICK_RATE. the server is authoritative:
+clients only send inputs and get the resulting state back.
+
+protocol: one json object per line in both directions.
+client -> server:
+    {"type": "join", "seed": 123}           starts a match, seed is optional and has to be in range(MAX_SEED)
+    {"type": "input", "action": "left"}     one of ACTIONS, applied on the next tick
+    {"type": "metrics"}                     asks for the scheduler metrics
+server -> client:
+    {"type": "match", "id": 1, "seed": 123}
+    {"type": "state", "frame": .., "score": .., "difficulty": .., "tet": [x, y, cells, colour], "rows": [..]}
+        sent after every tick that changed something, "rows" (BitLevel.rows) only when the board changed
+    {"type": "over", "score": .., "replay": ..}    replay is the match as a replay file (see replay.py), base64 encoded.
+        the match ends with it, send "join" to play again
+    {"type": "metrics", ...}                see MatchServer.get_metrics
+    {"type": "error", "message": ..}
+
+run ./server.py to serve, ./server.py --bench 300 to play 300 random clients over localhost.
+'''
+
+import json
+import base64
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+import replay
+from engine import BitLevel
+
+TICK_RATE = 60 # level updates per second, same as game.SIM_RATE
+MAX_CATCH_UP = 5 # ticks done at most per scheduler wake up, the server slows down instead of spiralling
+TICK_BUDGET = 0.0005 # seconds one match may take per tick before it counts as over budget
+MAX_INPUTS_PER_TICK = 8 # inputs applied per match and tick, the rest waits for the next tick
+MAX_QUEUED_INPUTS = 64 # inputs of a match waiting to be applied, more are dropped
+MAX_SEED = 1 << 64 # seeds have to be in range(MAX_SEED), replays store them unsigned
+MAX_WRITE_BUFFER = 64 * 1024 # state updates are skipped while a client has more than this unsent
+METRICS_WINDOW = 600 # ticks the scheduler metrics are calculated over
+
+ACTIONS = {"rotate": replay.ACTION_ROTATE,
+           "left": replay.ACTION_MOVE_L,
+           "right": replay.ACTION_MOVE_R,
+           "drop_on": replay.ACTION_DROP_ON,
+           "drop_off": replay.ACTION_DROP_OFF,
+           "hard_drop": replay.ACTION_HARD_DROP}
+
+def send(writer, message):
+    writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+class Match:
+    def __init__(self, match_id, seed, writer):
+        self.id = match_id
+        self.level = BitLevel(seed)
+        self.recorder = replay.Recorder(self.level)
+        self.writer = writer
+        self.inputs = deque()
+        self.over = False
+        self.board_changed = True
+        self.last_tet = False # (x, y, rot) sent last
+        self.ticks = 0
+        self.tick_time = 0 # seconds spent in tick
+        self.level.add_hook("locked", self.on_locked)
+        self.level.add_hook("game_over", self.on_game_over)
+
+    def on_locked(self):
+        self.board_changed = True
+
+    def on_game_over(self):
+        self.over = True
+
+    def add_input(self, action):
+        if len(self.inputs) < MAX_QUEUED_INPUTS:
+            self.inputs.append(action)
+
+    def tick(self):
+        '''
+        applies the queued inputs, updates the level once and sends the new state.
+        returns the seconds it took
+        '''
+        start = time.perf_counter()
+        for i in range(min(len(self.inputs), MAX_INPUTS_PER_TICK)):
+            if self.over:
+                break
+            action = self.inputs.popleft()
+            self.recorder.record(action)
+            replay.apply_action(self.level, action)
+        if not self.over:
+            self.level.update()
+        self.send_state()
+
+        duration = time.perf_counter() - start
+        self.ticks += 1
+        self.tick_time += duration
+        return duration
+
+    def send_state(self):
+        tet = self.level.get_tet()
+        position = (tet.grid_x, tet.grid_y, tet.rot_index)
+        if position == self.last_tet and not self.board_changed and not self.over:
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER and not self.over:
+            return # slow client, it gets the newest state once it caught up
+
+        message = {"type": "state",
+                   "frame": self.level.get_frame(),
+                   "score": self.level.get_score(),
+                   "difficulty": self.level.get_difficulty(),
+                   "tet": [tet.grid_x, tet.grid_y, tet.get_shape().cells, tet.get_color()]}
+        if self.board_changed:
+            message["rows"] = self.level.rows
+            self.board_changed = False
+        send(self.writer, message)
+        self.last_tet = position
+
+        if self.over:
+            self.recorder.finish()
+            send(self.writer, {"type": "over",
+                               "score": self.level.get_score(),
+                               "replay": base64.b64encode(self.recorder.get_bytes()).decode()})
+
+class MatchServer:
+    def __init__(self):
+        self.matches = {} # id -> Match
+        self.next_id = 1
+        self.running = False
+        self.round_times = deque(maxlen=METRICS_WINDOW) # seconds per scheduler round (all matches ticked once)
+        self.match_ticks = 0
+        self.match_tick_time = 0
+        self.over_budget = 0 # match ticks that took longer than TICK_BUDGET, kept when matches end
+        self.peak_matches = 0
+        self.overruns = 0 # rounds that took longer than one tick period
+        self.dropped_ticks = 0 # ticks skipped because the scheduler fell more than MAX_CATCH_UP behind
+        self.finished = 0 # matches that ended in a game over
+
+    async def handle_client(self, reader, writer):
+        match = False
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    send(writer, {"type": "error", "message": "line too long"})
+                    break
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    send(writer, {"type": "error", "message": "invalid json"})
+                    continue
+                if not isinstance(message, dict):
+                    send(writer, {"type": "error", "message": "message has to be a json object"})
+                    continue
+
+                kind = message.get("type")
+                if kind == "join":
+                    seed = message.get("seed")
+                    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or not 0 <= seed < MAX_SEED):
+                        send(writer, {"type": "error", "message": "seed has to be an integer in range(2**64)"})
+                        await writer.drain()
+                        continue
+                    if match != False:
+                        self.remove_match(match)
+                    match = Match(self.next_id, seed, writer)
+                    self.next_id += 1
+                    self.matches[match.id] = match
+                    self.peak_matches = max(self.peak_matches, len(self.matches))
+                    send(writer, {"type": "match", "id": match.id, "seed": match.level.get_seed()})
+                elif kind == "input":
+                    action = ACTIONS.get(message.get("action"))
+                    if match != False and match.over:
+                        match = False # already removed from the server by tick_all
+                    if match == False or action is None:
+                        send(writer, {"type": "error", "message": "no match or unknown action"})
+                    else:
+                        match.add_input(action)
+                elif kind == "metrics":
+                    send(writer, dict(self.get_metrics(), type="metrics"))
+                else:
+                    send(writer, {"type": "error", "message": "unknown message type"})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if match != False:
+                self.remove_match(match)
+            writer.close()
+
+    def remove_match(self, match):
+        self.matches.pop(match.id, False)
+
+    def tick_all(self):
+        start = time.perf_counter()
+        for match in list(self.matches.values()):
+            duration = match.tick()
+            self.match_tick_time += duration
+            self.match_ticks += 1
+            if duration > TICK_BUDGET:
+                self.over_budget += 1
+            if match.over:
+                self.finished += 1
+                self.remove_match(match) # its "over" message was sent in this tick
+        self.round_times.append(time.perf_counter() - start)
+
+    async def run_scheduler(self):
+        '''
+        ticks every match TICK_RATE times per second on a fixed timestep
+        '''
+        loop = asyncio.get_running_loop()
+        period = 1 / TICK_RATE
+        next_tick = loop.time()
+        self.running = True
+        while self.running:
+            now = loop.time()
+            due = int((now - next_tick) / period) + 1
+            if due > MAX_CATCH_UP:
+                self.dropped_ticks += due - MAX_CATCH_UP
+                next_tick += (due - MAX_CATCH_UP) * period
+                due = MAX_CATCH_UP
+            for i in range(due):
+                self.tick_all()
+                if self.round_times[-1] > period:
+                    self.overruns += 1
+                next_tick += period
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+
+    def get_metrics(self):
+        '''
+        round_ms: time to tick every match once (mean and 99th percentile over the last METRICS_WINDOW rounds),
+        match_tick_us: mean time of one match tick, capacity: matches one core could tick at TICK_RATE
+        with that cost, load: fraction of the tick period spent ticking
+        '''
+        rounds = sorted(self.round_times)
+        per_match = self.match_tick_time / self.match_ticks if self.match_ticks else 0
+        mean_round = sum(rounds) / len(rounds) if rounds else 0
+        return {"matches": len(self.matches),
+                "peak_matches": self.peak_matches,
+                "finished": self.finished,
+                "round_ms": mean_round * 1000,
+                "round_p99_ms": rounds[min(len(rounds) - 1, int(len(rounds) * 0.99))] * 1000 if rounds else 0,
+                "match_tick_us": per_match * 1e6,
+                "over_budget": self.over_budget,
+                "overruns": self.overruns,
+                "dropped_ticks": self.dropped_ticks,
+                "load": mean_round * TICK_RATE,
+                "capacity": int(1 / (per_match * TICK_RATE)) if per_match else 0}
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        scheduler = asyncio.create_task(self.run_scheduler())
+        return server, scheduler
+
+class MatchClient:
+    '''
+    minimal client, used by the benchmark
+    '''
+    async def connect(self, host="127.0.0.1", port=8765):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        return self
+
+    async def send(self, message):
+        send(self.writer, message)
+        await self.writer.drain()
+
+    async def receive(self):
+        line = await self.reader.readline()
+        if not line:
+            return False
+        return json.loads(line)
+
+    async def join(self, seed=None):
+        await self.send({"type": "join", "seed": seed})
+        return await self.receive()
+
+    def close(self):
+        self.writer.close()
+
+async def random_client(port, seconds, seed, stats):
+    '''
+    joins a match and sends a random input (no hard drops) about every 100 ms, starts a new match on game over
+    '''
+    rng = random.Random(seed)
+    client = await MatchClient().connect(port=port)
+    await client.join(seed)
+    end = time.perf_counter() + seconds
+
+    async def read():
+        while True:
+            message = await client.receive()
+            if message == False:
+                return
+            stats["messages"] += 1
+            if message["type"] == "over":
+                stats["games"] += 1
+                await client.send({"type": "join", "seed": rng.randrange(1 << 32)})
+
+    reader = asyncio.create_task(read())
+    while time.perf_counter() < end:
+        await asyncio.sleep(rng.uniform(0.05, 0.15))
+        await client.send({"type": "input", "action": rng.choice(("rotate", "left", "right", "drop_on", "drop_off"))})
+        stats["inputs"] += 1
+    reader.cancel()
+    client.close()
+
+async def bench(clients, seconds, port=0):
+    server = MatchServer()
+    listener, scheduler = await server.serve(port=port)
+    port = listener.sockets[0].getsockname()[1]
+    stats = {"messages": 0, "inputs": 0, "games": 0}
+
+    await asyncio.gather(*[random_client(port, seconds, seed, stats) for seed in range(clients)])
+
+    metrics = server.get_metrics()
+    server.running = False
+    listener.close()
+    await scheduler
+    return dict(metrics, **stats)
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio match server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--bench", type=int, default=0, help="play this many random clients over localhost and print the metrics")
+    parser.add_argument("--seconds", type=float, default=10, help="length of the benchmark")
+    args = parser.parse_args()
+
+    if args.bench:
+        result = asyncio.run(bench(args.bench, args.seconds))
+        print(json.dumps(result, indent=1))
+        return
+
+    async def serve():
+        server = MatchServer()
+        listener, scheduler = await server.serve(args.host, args.port)
+        print(f"serving on {args.host}:{args.port}")
+        while True:
+            await asyncio.sleep(10)
+            print(json.dumps(server.get_metrics()))
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
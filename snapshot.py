@@ -0,0 +1,114 @@
+'''
+binary snapshots of the full state of a level: board, falling tet with its tick counters,
+score, difficulty progress and the state of the rng, so a restored level plays on exactly
+like the original would have. hooks are not part of a snapshot.
+
+format (numbers are unsigned LEB128 varints, see replay.py):
+    MAGIC, VERSION byte
+    seed, frame, score, difficulty, difficulty_stage, difficulty_increase_on_stage, max_difficulty
+    tet: piece << 3 | colour byte, x + X_OFF, y, rot, dropping, tpf, tpf_adjusted, dropping_tpf, current_tick, move_on_tick
+    board: 21 * 10 cell colours, 4 bits each
+    rng: position varint, 624 words of the mersenne twister state as little endian uint32
+
+most of a snapshot (2.5 kB of about 2.6 kB) is the rng state.
+'''
+
+import sys
+from array import array
+from engine import BitLevel, Tet, all_pieces, piece_index, X_OFF, MAP_BYTES, pack_map, unpack_map
+from replay import write_varint, read_varint
+
+MAGIC = b"TSNP"
+VERSION = 1
+RNG_WORDS = 624 # words of random.Random's state, followed by the position in them
+
+def take(level):
+    '''
+    returns a snapshot of level as bytes
+    '''
+    data = bytearray(MAGIC)
+    data.append(VERSION)
+    for value in (level.get_seed(), level.frame, level.score, level.difficulty, level.difficulty_stage,
+                  level.difficulty_increase_on_stage, level.max_difficulty):
+        write_varint(data, value)
+
+    tet = level.get_tet()
+    data.append(piece_index[id(tet.shapes)] << 3 | tet.color)
+    for value in (tet.grid_x + X_OFF, tet.grid_y, tet.rot_index, tet.dropping, tet.tpf,
+                  tet.tpf_adjusted, tet.dropping_tpf, tet.current_tick, tet.move_on_tick):
+        write_varint(data, int(value)) # the tick values are whole numbers, some stored as floats
+
+    pack_map(level.map, data)
+
+    version, state, gauss = level.rng.getstate()
+    write_varint(data, state[RNG_WORDS])
+    words = array("I", state[:RNG_WORDS])
+    if sys.byteorder == "big":
+        words.byteswap()
+    data += words.tobytes()
+    return bytes(data)
+
+def restore(data, level_class=BitLevel):
+    '''
+    returns a new level of level_class in the state of the snapshot data
+    '''
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a snapshot")
+    if data[len(MAGIC)] != VERSION:
+        raise ValueError(f"unsupported snapshot version {data[len(MAGIC)]}")
+
+    pos = len(MAGIC) + 1
+    values = []
+    for i in range(7):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    seed, frame, score, difficulty, difficulty_stage, increase_on_stage, max_difficulty = values
+
+    level = level_class(seed)
+    level.frame = frame
+    level.score = score
+    level.difficulty_stage = difficulty_stage
+    level.difficulty_increase_on_stage = increase_on_stage
+    level.max_difficulty = max_difficulty
+    level.set_difficulty(difficulty)
+
+    piece = data[pos]
+    pos += 1
+    values = []
+    for i in range(9):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    tet = Tet(level, piece=all_pieces[piece >> 3])
+    tet.color = piece & 7
+    tet.grid_x = values[0] - X_OFF
+    tet.grid_y, tet.rot_index = values[1], values[2]
+    tet.dropping = values[3] == 1
+    tet.tpf = values[4]
+    tet.tpf_adjusted, tet.dropping_tpf, tet.current_tick = float(values[5]), float(values[6]), float(values[7])
+    tet.move_on_tick = values[8]
+    level.tet = tet
+
+    level.map = unpack_map(data, pos)
+    pos += MAP_BYTES
+    level.rebuild_from_map()
+
+    index, pos = read_varint(data, pos)
+    words = array("I")
+    words.frombytes(data[pos:pos + RNG_WORDS * 4])
+    if len(words) != RNG_WORDS:
+        raise ValueError("snapshot is truncated")
+    if sys.byteorder == "big":
+        words.byteswap()
+    level.rng.setstate((3, tuple(words) + (index,), None)) # set last, creating the tet above used the rng
+    return level
+
+def save(level, path):
+    file = open(path, "wb")
+    file.write(take(level))
+    file.close()
+
+def load(path, level_class=BitLevel):
+    file = open(path, "rb")
+    data = file.read()
+    file.close()
+    return restore(data, level_class)
@@ -0,0 +1,358 @@
+#!/usr/bin/python3
+
+'''
+compact stream of a level for spectators. the stream starts with a keyframe of the whole level,
+after that only changes are sent. a keyframe is repeated every KEYFRAME_INTERVAL frames and
+Encoder.make_keyframe gives one for spectators joining late.
+
+every message starts with a varint (frames since the previous message << 3 | kind), see replay.py
+for the varint format. keyframes start with 0 and carry the absolute frame instead. payloads:
+    KEYFRAME:   frame, score, difficulty, piece << 3 | colour, tet position, 21 * 10 cell colours (4 bits each)
+    FALL:       nothing, the tet moved down one row
+    MOVE:       tet position, (x + X_OFF) | rot << 4 | y << 6
+    LOCK:       score reward. the tet is locked where it is, full rows are cleared like Level.clear_lines
+    SPAWN:      piece << 3 | colour of the new tet, it starts at SPAWN_POSITION
+    DIFFICULTY: new difficulty
+    GAME_OVER:  nothing
+'''
+
+from engine import piece_table, piece_index, LEVEL_W, GRID_SIZE, X_OFF, MAP_BYTES, pack_map, unpack_map
+from replay import write_varint, read_varint
+
+KEYFRAME = 0
+FALL = 1
+MOVE = 2
+LOCK = 3
+SPAWN = 4
+DIFFICULTY = 5
+GAME_OVER = 6
+
+KEYFRAME_INTERVAL = 300 # frames between keyframes
+SPAWN_POSITION = (LEVEL_W // 2 // GRID_SIZE, 1, 0) # (x, y, rot) of a new tet, see Tet.__init__
+
+def pack_position(x, y, rot):
+    return (x + X_OFF) | rot << 4 | y << 6
+
+class Encoder:
+    '''
+    writes the stream of level, attached through its hooks. get the written bytes with take()
+    '''
+    def __init__(self, level, keyframe_interval=KEYFRAME_INTERVAL):
+        self.level = level
+        self.keyframe_interval = keyframe_interval
+        self.data = bytearray()
+        self.last_frame = level.get_frame() # frame of the last message
+        self.keyframe_frame = self.last_frame # frame of the last keyframe in the stream
+        self.tet_state = False # (x, y, rot) of the tet as the stream describes it
+        self.bytes_written = 0
+        level.add_hook("updated", self.on_updated)
+        level.add_hook("score", self.on_score)
+        level.add_hook("locked", self.on_locked)
+        level.add_hook("difficulty", self.on_difficulty)
+        level.add_hook("game_over", self.on_game_over)
+        self.write_keyframe(self.data, self.last_frame)
+
+    def detach(self):
+        self.level.remove_hook("updated", self.on_updated)
+        self.level.remove_hook("score", self.on_score)
+        self.level.remove_hook("locked", self.on_locked)
+        self.level.remove_hook("difficulty", self.on_difficulty)
+        self.level.remove_hook("game_over", self.on_game_over)
+        return self
+
+    def write_header(self, out, kind):
+        frame = self.level.get_frame()
+        write_varint(out, (frame - self.last_frame) << 3 | kind)
+        self.last_frame = frame
+
+    def write_keyframe(self, out, frame):
+        '''
+        the header of a keyframe has no frame delta, it carries the absolute frame
+        '''
+        level = self.level
+        tet = level.get_tet()
+        write_varint(out, KEYFRAME)
+        write_varint(out, frame)
+        write_varint(out, level.get_score())
+        write_varint(out, level.get_difficulty())
+        out.append(piece_index[id(tet.shapes)] << 3 | tet.get_color())
+        write_varint(out, pack_position(tet.grid_x, tet.grid_y, tet.rot_index))
+        pack_map(level.map, out)
+        self.tet_state = (tet.grid_x, tet.grid_y, tet.rot_index)
+
+    def make_keyframe(self):
+        '''
+        returns a standalone keyframe of the current state for a spectator that joins now,
+        the messages take() returns after this continue from it
+        '''
+        self.flush_tet()
+        out = bytearray()
+        self.write_keyframe(out, self.last_frame)
+        return bytes(out)
+
+    def flush_tet(self):
+        tet = self.level.get_tet()
+        state = (tet.grid_x, tet.grid_y, tet.rot_index)
+        if state == self.tet_state:
+            return
+        if self.tet_state != False and state == (self.tet_state[0], self.tet_state[1] + 1, self.tet_state[2]):
+            self.write_header(self.data, FALL)
+        else:
+            self.write_header(self.data, MOVE)
+            write_varint(self.data, pack_position(*state))
+        self.tet_state = state
+
+    def on_updated(self):
+        frame = self.level.get_frame()
+        if frame - self.keyframe_frame >= self.keyframe_interval:
+            self.write_keyframe(self.data, frame)
+            self.last_frame = frame
+            self.keyframe_frame = frame
+        else:
+            self.flush_tet()
+
+    def on_score(self, reward):
+        '''
+        called while the locked tet is still the current one
+        '''
+        self.flush_tet()
+        self.write_header(self.data, LOCK)
+        write_varint(self.data, reward)
+
+    def on_locked(self):
+        tet = self.level.get_tet()
+        self.write_header(self.data, SPAWN)
+        self.data.append(piece_index[id(tet.shapes)] << 3 | tet.get_color())
+        self.tet_state = SPAWN_POSITION
+        self.flush_tet()
+
+    def on_difficulty(self, difficulty):
+        self.write_header(self.data, DIFFICULTY)
+        write_varint(self.data, difficulty)
+
+    def on_game_over(self):
+        self.write_header(self.data, GAME_OVER)
+
+    def take(self):
+        '''
+        returns the bytes written since the last call
+        '''
+        out = bytes(self.data)
+        self.data.clear()
+        self.bytes_written += len(out)
+        return out
+
+class SpectatorTet:
+    '''
+    the falling tet as a spectator sees it, has the getters drawTet needs
+    '''
+    def __init__(self, piece, color, x, y, rot):
+        self.shapes = piece_table[piece]
+        self.color = color
+        self.grid_x = x
+        self.grid_y = y
+        self.rot_index = rot
+
+    def get_shape(self):
+        return self.shapes[self.rot_index]
+
+    def get_color(self):
+        return self.color
+
+    def get_x(self):
+        return self.grid_x * GRID_SIZE
+
+    def get_y(self):
+        return self.grid_y * GRID_SIZE
+
+    def set_position(self, packed):
+        self.grid_x = (packed & 15) - X_OFF
+        self.rot_index = packed >> 4 & 3
+        self.grid_y = packed >> 6
+
+class Decoder:
+    '''
+    rebuilds a level from a stream. has get_map, get_tet, get_drop_y and hooks ("locked"),
+    so drawLevel, drawTet and LevelRenderer can draw it like a Level. messages before the first
+    keyframe are skipped
+    '''
+    def __init__(self):
+        self.buffer = bytearray()
+        self.synced = False
+        self.map = [[0 for i in range(10)] for j in range(21)]
+        self.tet = False
+        self.frame = 0
+        self.score = 0
+        self.difficulty = 1
+        self.game_over = False
+        self.hooks = {}
+
+    def add_hook(self, event, fun):
+        if event not in self.hooks:
+            self.hooks[event] = []
+        self.hooks[event].append(fun)
+        return self
+
+    def remove_hook(self, event, fun):
+        if event in self.hooks and fun in self.hooks[event]:
+            self.hooks[event].remove(fun)
+        return self
+
+    def emit(self, event, *args):
+        if event in self.hooks:
+            for fun in self.hooks[event]:
+                fun(*args)
+
+    def get_map(self):
+        return self.map.copy()
+
+    def get_tet(self):
+        return self.tet
+
+    def get_score(self):
+        return self.score
+
+    def get_difficulty(self):
+        return self.difficulty
+
+    def get_frame(self):
+        return self.frame
+
+    def collides(self, x, y, rot):
+        shape = self.tet.shapes[rot]
+        if x < shape.col_min or x > shape.col_max or y > shape.row_max:
+            return True
+        for pr in shape.cells:
+            if self.map[y + pr[1]][x + pr[0]] != 0:
+                return True
+        return False
+
+    def get_drop_y(self):
+        tet = self.tet
+        y = tet.grid_y
+        while not self.collides(tet.grid_x, y + 1, tet.rot_index):
+            y += 1
+        return y
+
+    def feed(self, data):
+        '''
+        parses all complete messages in data and what was left over from the last call,
+        returns the amount of messages parsed
+        '''
+        self.buffer += data
+        pos = 0
+        messages = 0
+        while pos < len(self.buffer):
+            try:
+                pos = self.parse(pos)
+            except IndexError:
+                break # message is not complete yet
+            messages += 1
+        del self.buffer[:pos]
+        return messages
+
+    def parse(self, pos):
+        '''
+        parses and applies the message at pos, returns the position after it.
+        nothing is changed before the whole message was read
+        '''
+        data = self.buffer
+        value, pos = read_varint(data, pos)
+        frame = self.frame + (value >> 3)
+        kind = value & 7
+
+        if kind == KEYFRAME:
+            frame, pos = read_varint(data, pos)
+            score, pos = read_varint(data, pos)
+            difficulty, pos = read_varint(data, pos)
+            piece = data[pos]
+            position, pos = read_varint(data, pos + 1)
+            level_map = unpack_map(data, pos)
+            pos += MAP_BYTES
+            self.score = score
+            self.difficulty = difficulty
+            self.tet = SpectatorTet(piece >> 3, piece & 7, 0, 0, 0)
+            self.tet.set_position(position)
+            self.map = level_map
+            self.game_over = False
+            self.synced = True
+            self.frame = frame
+            self.emit("locked")
+            return pos
+
+        if kind == MOVE or kind == LOCK or kind == DIFFICULTY:
+            payload, pos = read_varint(data, pos)
+        elif kind == SPAWN:
+            payload = data[pos]
+            pos += 1
+        self.frame = frame
+        if not self.synced:
+            return pos
+
+        if kind == FALL:
+            self.tet.grid_y += 1
+        elif kind == MOVE:
+            self.tet.set_position(payload)
+        elif kind == LOCK:
+            self.lock(payload)
+        elif kind == SPAWN:
+            self.tet = SpectatorTet(payload >> 3, payload & 7, *SPAWN_POSITION)
+            self.emit("locked")
+        elif kind == DIFFICULTY:
+            self.difficulty = payload
+        elif kind == GAME_OVER:
+            self.game_over = True
+        return pos
+
+    def lock(self, reward):
+        tet = self.tet
+        for pr in tet.get_shape().cells:
+            self.map[tet.grid_y + pr[1]][tet.grid_x + pr[0]] = tet.color
+        for row_index in range(21):
+            if 0 not in self.map[row_index]:
+                del self.map[row_index]
+                self.map.insert(1, [0 for i in range(10)]) # same as Level.push_lines
+        self.score += reward
+
+def measure_rates(seconds=120, difficulties=(1, 5, 10, 15, 20), seed=0):
+    '''
+    bytes per second of the stream for games with random inputs at a fixed difficulty,
+    returns {difficulty: bytes per second}
+    '''
+    import random
+    from engine import BitLevel
+
+    rates = {}
+    for difficulty in difficulties:
+        moves = random.Random(seed)
+        frames = 0
+        total = 0
+        level = False
+        while frames < seconds * 60:
+            if level == False or level.check_game_over():
+                if level != False:
+                    total += len(encoder.detach().take())
+                level = BitLevel(moves.randrange(1 << 32))
+                level.difficulty_increase_on_stage = float("inf")
+                level.set_difficulty(difficulty)
+                encoder = Encoder(level)
+
+            tet = level.get_tet()
+            move = moves.random()
+            if move < 0.03:
+                tet.move_l()
+            elif move < 0.06:
+                tet.move_r()
+            elif move < 0.08:
+                tet.try_rotate()
+            level.update()
+            frames += 1
+            total += len(encoder.take())
+        rates[difficulty] = total / seconds
+    return rates
+
+if __name__ == "__main__":
+    full = (21 * 10 + 4) * 60 # whole map and tet every frame, one byte each
+    print(f"whole state every frame: {full} bytes/s")
+    for difficulty, rate in measure_rates().items():
+        print(f"difficulty {difficulty:2}: {rate:7.1f} bytes/s ({full / rate:.0f}x smaller)")
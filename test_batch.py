@@ -0,0 +1,113 @@
+'''
+BatchLevel has to play exactly like BitLevel, it is stepped next to BitLevels on the same boards
+'''
+
+import random
+import pytest
+
+np = pytest.importorskip("numpy")
+import batch
+from engine import Tet, all_pieces
+from testing import random_rows, make_level
+
+def test_assimilate_matches_bitlevel():
+    '''
+    locking and row compaction of many boards at once leaves the same rows and score as BitLevel.assimilate
+    '''
+    rng = random.Random(0)
+    for round in range(50):
+        n = 64
+        boards = batch.BatchLevel(n, seed=round)
+        levels = []
+        for i in range(n):
+            rows = random_rows(rng)
+            level = make_level(rows, int(boards.piece[i]))
+            tet = level.get_tet()
+            tet.rot_index = rng.randrange(len(tet.shapes))
+            shape = tet.get_shape()
+            tet.grid_x = rng.randint(shape.col_min, shape.col_max)
+            tet.grid_y = level.get_drop_y()
+            levels.append(level)
+
+            boards.boards[i, :21] = rows
+            boards.rot[i] = tet.rot_index
+            boards.x[i] = tet.grid_x
+            boards.y[i] = tet.grid_y
+
+        reward = np.zeros(n, dtype=np.int64)
+        cleared = np.zeros(n, dtype=np.int64)
+        boards.assimilate(np.arange(n), reward, cleared)
+
+        for i, level in enumerate(levels):
+            lines = []
+            level.add_hook("lines", lines.append)
+            level.assimilate()
+            assert boards.get_rows()[i].tolist() == level.get_rows()
+            assert reward[i] == level.get_score()
+            assert cleared[i] == sum(lines)
+            assert boards.game_over[i] == level.check_game_over()
+
+def test_step_matches_bitlevel():
+    '''
+    BatchLevel.step and BitLevel driven by the same actions through the Tet moves give the same game
+    frame by frame. every piece is steered to a random column and rotation and then dropped, boards that are
+    game over start again. the BitLevel is handed the piece the batch spawned, as the two use different rngs
+    '''
+    n = 16
+    rng = random.Random(1)
+    boards = batch.BatchLevel(n, seed=1)
+    levels = [False for i in range(n)]
+    targets = [False for i in range(n)] # (x, rot) the current piece of every board is steered to
+    lines = 0
+
+    for frame in range(5000):
+        for i in range(n):
+            if levels[i] == False or levels[i].check_game_over():
+                boards.reset([i])
+                rows = random_rows(rng)
+                boards.boards[i, :21] = rows
+                levels[i] = make_level(rows, int(boards.piece[i]), seed=frame * n + i)
+                targets[i] = False
+            if targets[i] == False or levels[i].get_tet().grid_y == 1:
+                tet = levels[i].get_tet()
+                targets[i] = (rng.randrange(10), rng.randrange(len(tet.shapes)))
+
+        actions = []
+        for i, level in enumerate(levels):
+            tet = level.get_tet()
+            x, rot = targets[i]
+            if rng.random() < 0.1:
+                actions.append(rng.randrange(5))
+            elif tet.rot_index != rot:
+                actions.append(batch.ACTION_ROTATE)
+            elif tet.grid_x < x:
+                actions.append(batch.ACTION_RIGHT)
+            elif tet.grid_x > x:
+                actions.append(batch.ACTION_LEFT)
+            else:
+                actions.append(batch.ACTION_DROP)
+        reward, cleared, game_over = boards.step(actions)
+
+        for i, level in enumerate(levels):
+            tet = level.get_tet()
+            tet.set_dropping(actions[i] == batch.ACTION_DROP)
+            if actions[i] == batch.ACTION_LEFT:
+                tet.move_l()
+            elif actions[i] == batch.ACTION_RIGHT:
+                tet.move_r()
+            elif actions[i] == batch.ACTION_ROTATE:
+                tet.try_rotate()
+            score = level.get_score()
+            level.update()
+            if level.get_tet() is not tet:
+                level.tet = Tet(level, piece=all_pieces[int(boards.piece[i])])
+
+            tet = level.get_tet()
+            assert boards.get_rows()[i].tolist() == level.get_rows()
+            assert (boards.x[i], boards.y[i], boards.rot[i]) == (tet.grid_x, tet.grid_y, tet.rot_index)
+            assert reward[i] == level.get_score() - score
+            assert boards.score[i] == level.get_score()
+            assert game_over[i] == level.check_game_over()
+            lines += cleared[i]
+
+    assert lines > 0 # the run has to clear lines to check anything about them
@@ -0,0 +1,29 @@
+'''
+layout work of gui elements
+'''
+
+import gui
+import assets
+
+def build_menu(size):
+    menu = gui.Container(200, 400).add_child(gui.Text("menu", assets.get_font(50)))
+    for i in range(size):
+        menu.add_child(gui.Button(gui.Text(f"button {i}", assets.get_font(35))))
+    return menu
+
+def test_idle_menu_does_no_layout():
+    menu = build_menu(20)
+    menu.update()
+    gui.reset_layout_passes()
+    menu.update()
+    assert gui.reset_layout_passes() == 0
+
+def test_changed_text_lays_out_again():
+    menu = build_menu(20)
+    menu.update()
+    gui.reset_layout_passes()
+    menu.get_child(0).set_content("another title")
+    menu.update()
+    assert gui.reset_layout_passes() > 0
+    menu.update()
+    assert gui.reset_layout_passes() == 0
@@ -0,0 +1,57 @@
+'''
+ScoreIndex has to rank and order scores exactly like the plain list FileHandler kept before it
+'''
+
+import random
+import pytest
+import scores
+from scores import ScoreIndex
+
+def insert_score(score_data, name, score):
+    '''
+    how FileHandler kept its list of scores before ScoreIndex: inserted in front of the first score
+    that is not higher, returns the rank
+    '''
+    for index, element in enumerate(score_data):
+        if element[1] <= score:
+            score_data.insert(index, (name, score))
+            return index + 1
+    score_data.append((name, score))
+    return len(score_data)
+
+@pytest.mark.parametrize("block_size", (1, 2, 5, 512))
+def test_matches_sorted_list(block_size, monkeypatch):
+    '''
+    small blocks split often, so the fenwick tree is checked over many blocks
+    '''
+    monkeypatch.setattr(scores, "BLOCK_SIZE", block_size)
+    rng = random.Random(block_size)
+    for round in range(20):
+        score_data = [(f"loaded{i}", rng.randrange(50)) for i in range(rng.randrange(200))]
+        score_data.sort(key=lambda element: -element[1])
+        index = ScoreIndex(score_data)
+        assert list(index) == score_data
+
+        for i in range(300):
+            score = rng.randrange(60)
+            higher = sum(1 for element in score_data if element[1] > score)
+            assert index.rank(score) == higher + 1
+
+            name = f"player{rng.randrange(10)}"
+            assert index.add(name, score) == insert_score(score_data, name, score)
+            assert len(index) == len(score_data)
+
+        assert list(index) == score_data
+        for k in (0, 1, 11, len(score_data), len(score_data) + 5):
+            assert index.top(k) == score_data[:k]
+        for name in set(element[0] for element in score_data):
+            assert index.get_best(name) == max(element[1] for element in score_data if element[0] == name)
+        assert index.get_best("nobody") == False
+
+def test_empty():
+    index = ScoreIndex()
+    assert index.rank(10) == 1
+    assert index.top(5) == []
+    assert index.add("a", 10) == 1
+    assert index.add("b", 10) == 1 # equal scores: newest first
+    assert list(index) == [("b", 10), ("a", 10)]
@@ -0,0 +1,77 @@
+'''
+every placement find_placements returns has to be reachable with the moves of Tet and lock into the board it claims
+'''
+
+import random
+import pytest
+import search
+from engine import Level, BitLevel, Tet, all_pieces, piece_index
+from testing import random_rows, make_level
+
+def random_level(level_class, rng):
+    return make_level(random_rows(rng), rng.randrange(7), level_class, rng.randrange(1 << 32))
+
+def copy_level(level):
+    copy = type(level)(level.get_seed())
+    copy.map = [row.copy() for row in level.map]
+    copy.rebuild_from_map()
+    tet = level.get_tet()
+    copy.tet = Tet(copy, piece=all_pieces[piece_index[id(tet.shapes)]])
+    copy.tet.grid_x, copy.tet.grid_y, copy.tet.rot_index = tet.grid_x, tet.grid_y, tet.rot_index
+    return copy
+
+@pytest.mark.parametrize("level_class", (Level, BitLevel))
+def test_paths_replay_with_tet_moves(level_class):
+    '''
+    following the path of every placement with the moves of Tet reaches the placement, where the tet
+    can't fall further, and locking it there gives the rows and score of the placement
+    '''
+    rng = random.Random(0)
+    for round in range(100):
+        level = random_level(level_class, rng)
+        placements = search.level_placements(level)
+        assert placements
+        for placement in placements:
+            copy = copy_level(level)
+            tet = copy.get_tet()
+            for move in placement.get_path():
+                state = (tet.grid_x, tet.grid_y, tet.rot_index)
+                if move == "left":
+                    tet.move_l()
+                elif move == "right":
+                    tet.move_r()
+                elif move == "rotate":
+                    tet.try_rotate()
+                else:
+                    assert not copy.collides(0, 1)
+                    tet.grid_y += 1
+                assert (tet.grid_x, tet.grid_y, tet.rot_index) != state, move
+
+            assert (tet.grid_x, tet.grid_y, tet.rot_index) == (placement.x, placement.y, placement.rot)
+            assert copy.collides(0, 1)
+            copy.assimilate()
+            assert tuple(copy.get_rows()) == placement.rows
+            assert copy.get_score() == placement.score
+            assert copy.check_game_over() == placement.game_over
+
+@pytest.mark.parametrize("level_class", (Level, BitLevel))
+def test_hard_drops_are_found(level_class):
+    '''
+    every column and rotation the tet can be moved to at the top and hard dropped from is one of the
+    placements, and no two placements leave the same rows
+    '''
+    rng = random.Random(1)
+    for round in range(100):
+        level = random_level(level_class, rng)
+        placements = search.level_placements(level)
+        boards = [placement.rows for placement in placements]
+        assert len(set(boards)) == len(boards)
+
+        shapes = level.get_tet().shapes
+        for rot in range(len(shapes)):
+            for x in range(shapes[rot].col_min, shapes[rot].col_max + 1):
+                copy = copy_level(level)
+                copy.get_tet().rot_index = rot
+                copy.get_tet().grid_x = x
+                copy.get_tet().hard_drop()
+                assert tuple(copy.get_rows()) in boards
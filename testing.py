@@ -0,0 +1,29 @@
+'''
+boards for the differential tests, so every test builds them the same way
+'''
+
+from engine import BitLevel, Tet, all_pieces, FULL_ROW
+
+def random_rows(rng):
+    '''
+    21 row bitmasks with the top 6 rows empty. below, most rows are full except for one well column, so
+    locking a tet clears lines, the others are random with at least one hole (holes, overhangs)
+    '''
+    rows = [0 for y in range(21)]
+    well = rng.randrange(10)
+    for y in range(6, 21):
+        if rng.random() < 0.7:
+            rows[y] = FULL_ROW & ~(1 << well)
+        else:
+            rows[y] = rng.randrange(1 << 10) & ~(1 << rng.randrange(10))
+    return rows
+
+def make_level(rows, piece, level_class=BitLevel, seed=0):
+    '''
+    level_class with the blocks of rows (all colour 1) and a new tet of all_pieces[piece] at the top
+    '''
+    level = level_class(seed)
+    level.map = [[1 if row >> x & 1 else 0 for x in range(10)] for row in rows]
+    level.rebuild_from_map()
+    level.tet = Tet(level, piece=all_pieces[piece])
+    return level